@@ -1,2 +1,2 @@
-from .make_env import make_env
+from .make_env import make_env, make_vec_env
 from .config import games
\ No newline at end of file
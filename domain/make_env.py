@@ -54,7 +54,7 @@ def make_env(env_name, seed=-1, render_mode=False):
     from domain.reversi import ReversiEnv
     height, width = env_name[8:].split('_')
     height, width = int(height), int(width)
-    env = ReversiEnv(size=(height, width))
+    env = ReversiEnv(size=(height, width), engine='bitboard')
 
   # -- Other  -------------------------------------------------------- -- #
   else:
@@ -63,4 +63,16 @@ def make_env(env_name, seed=-1, render_mode=False):
   if (seed >= 0):
     domain.seed(seed)
 
-  return env
\ No newline at end of file
+  return env
+
+
+def make_vec_env(env_name, nEnvs, autoreset=True):
+  """Creates environment running nEnvs games at once, only available for Reversi
+  """
+  if (env_name.startswith("reversi_")):
+    from domain.reversi import VecReversiEnv
+    height, width = env_name[8:].split('_')
+    height, width = int(height), int(width)
+    return VecReversiEnv(size=(height, width), n_envs=nEnvs, autoreset=autoreset)
+
+  raise ValueError('No vectorized environment for ' + env_name)
@@ -8,6 +8,7 @@ from .simulation import Simulation
 from .backend import LiveBackend
 from .board import Color
 from .environment import Environment
+from .vec_environment import VecReversiEnv
 
 
 class ReversiEnv:
@@ -22,10 +23,11 @@ class ReversiEnv:
     LINES_COLOR = (0, 150, 0)
     TEXT_COLOR = (0, 0, 0)
 
-    def __init__(self, size, delay=0.2):
+    def __init__(self, size, delay=0.2, engine='numpy'):
         self.__size = size
         self.__delay = delay
-        self.__simulation = Simulation.create_initial(size, LiveBackend(size))
+        backend = LiveBackend(size, engine)
+        self.__simulation = Simulation.create_initial(size, backend)
         self.__env = Environment(size, backend)
         self.__color = None
         self.__last_move = None
@@ -50,9 +52,11 @@ class ReversiEnv:
         for move in legal_moves:
             legal_moves_matrix[move[0], move[1]] = 1
 
+        # Only legal moves may win the tie-break, an illegal field scoring 0 could otherwise
+        # beat legal moves with negative values
         moves_values = nn_predictions * legal_moves_matrix
-        best_value = np.max(moves_values)
-        best_moves = np.argwhere(moves_values == best_value)
+        best_value = np.max(moves_values[legal_moves_matrix == 1])
+        best_moves = np.argwhere((moves_values == best_value) & (legal_moves_matrix == 1))
         best_move = random.choice(best_moves)
         self.__simulation.make_move(best_move)
         self.__last_move = best_move
@@ -61,6 +65,17 @@ class ReversiEnv:
 
         return self.__get_state(), self.__get_reward(), self.__is_done(), {}
 
+    def get_legal_moves(self):
+        legal_moves = np.zeros(self.__size, dtype=bool)
+        if not self.__simulation.is_finished():
+            for move in self.__simulation.get_moves():
+                legal_moves[move[0], move[1]] = True
+        return legal_moves.flatten()
+
+    def get_number(self):
+        """Board.number of the board seen by the agent, identifies the observation."""
+        return self.__simulation.board.to_relative(self.__color).number
+
     def render(self, mode='human', close=False):
         self.__show_gui = True
         self.__init_gui_if_needed()
@@ -1,12 +1,27 @@
 from abc import ABC, abstractmethod
 
+from .bitboard import BitBoard
+from .board import Board
 from .simulation import Simulation
 
 
+BOARD_ENGINES = {
+    'numpy': Board,
+    'bitboard': BitBoard,
+}
+
+
 class Backend(ABC):
 
-    def __init__(self, size):
+    def __init__(self, size, engine='numpy'):
+        if engine not in BOARD_ENGINES:
+            raise ValueError(f'Unknown board engine: {engine}')
         self._size = size
+        self._engine = engine
+
+    @property
+    def board_class(self):
+        return BOARD_ENGINES[self._engine]
 
     @abstractmethod
     def get_all_possible_boards_numbers(self):
@@ -26,7 +41,7 @@ class Backend(ABC):
 
     def _generate_all_possible_boards(self):
         boards = set()
-        simulations = {Simulation.create_initial(self._size, LiveBackend(self._size))}
+        simulations = {Simulation.create_initial(self._size, LiveBackend(self._size, self._engine))}
 
         while simulations:
             simulation = simulations.pop()
@@ -48,8 +63,8 @@ class Backend(ABC):
 
 class LiveBackend(Backend):
 
-    def __init__(self, size):
-        super().__init__(size)
+    def __init__(self, size, engine='numpy'):
+        super().__init__(size, engine)
         self.__boards_numbers = None
 
     def get_all_possible_boards_numbers(self):
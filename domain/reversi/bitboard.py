@@ -0,0 +1,249 @@
+from functools import lru_cache
+
+import numpy as np
+
+from .board import Color
+
+
+DIRECTIONS = [(i, j) for i in [-1, 0, 1] for j in [-1, 0, 1] if not (i == 0 and j == 0)]
+
+
+@lru_cache(maxsize=None)
+def get_shifts(size):
+    """Returns (shift, mask) pair for every direction on board of given size.
+
+    Bit y*width+x of mask represents field (y, x). Positive shift moves bits towards
+    higher indices. Mask clears bits which wrapped around the board edge or fell out of it.
+    """
+    height, width = size
+    full = (1 << (height * width)) - 1
+    first_column = sum(1 << (y * width) for y in range(height))
+    last_column = first_column << (width - 1)
+
+    shifts = []
+    for dy, dx in DIRECTIONS:
+        mask = full
+        if dx == 1:
+            mask &= ~first_column
+        elif dx == -1:
+            mask &= ~last_column
+        shifts.append((dy * width + dx, mask))
+    return tuple(shifts)
+
+
+@lru_cache(maxsize=None)
+def get_number_tables(size):
+    """Returns lookup tables converting masks to Board.number representation.
+
+    Board.number stores every field as 2 bits (value+1), first field being the most
+    significant. Tables map every byte of the mask to the sum of 4**(n-1-i) over its set bits.
+    """
+    n = size[0] * size[1]
+    ones = sum(4 ** i for i in range(n))
+    tables = []
+    for offset in range(0, n, 8):
+        table = []
+        for byte in range(256):
+            value = 0
+            for bit in range(8):
+                if byte >> bit & 1 and offset + bit < n:
+                    value += 4 ** (n - 1 - offset - bit)
+            table.append(value)
+        tables.append(table)
+    return ones, tuple(tables)
+
+
+def shift(mask, shift_, shift_mask):
+    if shift_ > 0:
+        return (mask << shift_) & shift_mask
+    return (mask >> -shift_) & shift_mask
+
+
+def spread(mask, tables):
+    value = 0
+    for table in tables:
+        value += table[mask & 0xFF]
+        mask >>= 8
+    return value
+
+
+def count_bits(mask):
+    return bin(mask).count('1')
+
+
+def masks_to_number(white, black, size):
+    ones, tables = get_number_tables(size)
+    return ones + spread(white, tables) - spread(black, tables)
+
+
+class BitBoard:
+    """Board keeping discs of each color as integer bitmasks.
+
+    Drop-in replacement for Board with the same public API. Field (y, x) is stored
+    under bit y*width+x, so moves are generated in the same order as by Board.
+    """
+
+    def __init__(self, white, black, size):
+        self.__white = white
+        self.__black = black
+        self.__size = tuple(size)
+
+    def __getitem__(self, item):
+        bit = 1 << (item[0] * self.__size[1] + item[1])
+        if self.__white & bit:
+            return Color.WHITE
+        if self.__black & bit:
+            return Color.BLACK
+        return Color.ANY
+
+    def __neg__(self):
+        return BitBoard(self.__black, self.__white, self.__size)
+
+    def __hash__(self):
+        return self.number
+
+    def __eq__(self, other):
+        return self.number == other.number
+
+    def __str__(self):
+        return str(self.as_numpy_array())
+
+    @staticmethod
+    def create_initial(size):
+        height, width = size
+        center_y, center_x = height // 2 - 1, width // 2 - 1
+        top_left = 1 << (center_y * width + center_x)
+        bottom_left = 1 << ((center_y + 1) * width + center_x)
+        white = top_left | bottom_left << 1
+        black = bottom_left | top_left << 1
+        return BitBoard(white, black, size)
+
+    @staticmethod
+    def create_from_number(number, size):
+        white = black = 0
+        shifted_number = number
+        for i in reversed(range(size[0] * size[1])):
+            value = (shifted_number & 0b11) - 1
+            if value == Color.WHITE:
+                white |= 1 << i
+            elif value == Color.BLACK:
+                black |= 1 << i
+            shifted_number >>= 2
+        return BitBoard(white, black, size)
+
+    @property
+    def number(self):
+        return masks_to_number(self.__white, self.__black, self.__size)
+
+    @property
+    def size(self):
+        return self.__size
+
+    def get_mask(self, color):
+        if color == Color.WHITE:
+            return self.__white
+        elif color == Color.BLACK:
+            return self.__black
+        return self.__full_mask & ~(self.__white | self.__black)
+
+    def as_numpy_array(self):
+        return self.to_vector().reshape(self.__size)
+
+    def copy(self):
+        return BitBoard(self.__white, self.__black, self.__size)
+
+    def to_relative(self, my_color):
+        return self.copy() if my_color == Color.WHITE else -self
+
+    def to_absolute(self, my_color):
+        return self.copy() if my_color == Color.WHITE else -self
+
+    def is_valid_position(self, position):
+        return 0 <= position[0] < self.size[0] and 0 <= position[1] < self.size[1]
+
+    def get_discs_count(self, color):
+        return count_bits(self.get_mask(color))
+
+    def get_legal_moves(self, color):
+        moves = self.get_legal_moves_mask(color)
+        width = self.__size[1]
+        positions = []
+        index = 0
+        while moves:
+            if moves & 1:
+                positions.append((index // width, index % width))
+            moves >>= 1
+            index += 1
+        return np.array(positions).reshape(-1, 2).astype(np.int_)
+
+    def get_legal_moves_mask(self, color):
+        player, opponent = self.__get_player_and_opponent(color)
+        empty = self.__full_mask & ~(player | opponent)
+        max_run = max(self.__size) - 2
+
+        moves = 0
+        for shift_, shift_mask in get_shifts(self.__size):
+            run = shift(player, shift_, shift_mask) & opponent
+            for _ in range(max_run - 1):
+                run |= shift(run, shift_, shift_mask) & opponent
+            moves |= shift(run, shift_, shift_mask) & empty
+        return moves
+
+    def make_move(self, position, color):
+        if not self.is_valid_position(position):
+            raise Exception('Tried to perform illegal move')
+        move = 1 << (int(position[0]) * self.__size[1] + int(position[1]))
+        player, opponent = self.__get_player_and_opponent(color)
+        flips = self.__get_flips(move, player, opponent)
+        if (player | opponent) & move or not flips:
+            raise Exception('Tried to perform illegal move')
+
+        player |= move | flips
+        opponent &= ~flips
+        if color == Color.WHITE:
+            self.__white, self.__black = player, opponent
+        else:
+            self.__white, self.__black = opponent, player
+        return self
+
+    def is_finished(self):
+        return self.is_full() or self.no_one_has_moves()
+
+    def get_winner(self):
+        return int(np.sign(count_bits(self.__white) - count_bits(self.__black)))
+
+    def is_full(self):
+        return (self.__white | self.__black) == self.__full_mask
+
+    def no_one_has_moves(self):
+        return not self.has_any_moves(Color.WHITE) and not self.has_any_moves(Color.BLACK)
+
+    def has_any_moves(self, color):
+        return self.get_legal_moves_mask(color) != 0
+
+    def to_vector(self):
+        bits = np.arange(self.__size[0] * self.__size[1], dtype=np.uint64)
+        white = (np.uint64(self.__white) >> bits) & np.uint64(1)
+        black = (np.uint64(self.__black) >> bits) & np.uint64(1)
+        return white.astype(np.byte) - black.astype(np.byte)
+
+    @property
+    def __full_mask(self):
+        return (1 << (self.__size[0] * self.__size[1])) - 1
+
+    def __get_player_and_opponent(self, color):
+        if color == Color.WHITE:
+            return self.__white, self.__black
+        return self.__black, self.__white
+
+    def __get_flips(self, move, player, opponent):
+        flips = 0
+        for shift_, shift_mask in get_shifts(self.__size):
+            run = 0
+            position = shift(move, shift_, shift_mask)
+            while position & opponent:
+                run |= position
+                position = shift(position, shift_, shift_mask)
+            if position & player:
+                flips |= run
+        return flips
@@ -1,4 +1,4 @@
-from .board import Board, Side
+from .board import Side
 from .simulation import Simulation
 
 
@@ -62,4 +62,4 @@ class Environment:
         return board.number
 
     def cvt_state_to_board(self, state):
-        return Board.create_from_number(state, self.__size)
+        return self.__backend.board_class.create_from_number(state, self.__size)
@@ -0,0 +1,92 @@
+import numpy as np
+
+from .bitboard import get_shifts
+
+
+class MoveKernel:
+    """Move generation for arrays of boards stored as numpy uint64 bitmasks.
+
+    Every method takes arrays of player/opponent masks (one element per board, bit
+    y*width+x being field (y, x)) and processes all boards at once, without a Python
+    loop over them. Supports boards of up to 64 fields.
+    """
+
+    ONE = np.uint64(1)
+
+    def __init__(self, size):
+        if size[0] * size[1] > 64:
+            raise ValueError(f'Board {size[0]}x{size[1]} does not fit into uint64 mask')
+        self.__size = tuple(size)
+        self.__cells = size[0] * size[1]
+        self.__full = np.uint64((1 << self.__cells) - 1)
+        self.__max_run = max(size) - 2
+        self.__bits = np.arange(self.__cells, dtype=np.uint64)
+        self.__shifts = [(np.uint64(abs(shift)), shift > 0, np.uint64(mask)) for shift, mask in get_shifts(self.__size)]
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def cells(self):
+        return self.__cells
+
+    def get_legal_moves(self, player, opponent):
+        empty = ~(player | opponent) & self.__full
+        moves = np.zeros_like(player)
+        for shift in self.__shifts:
+            run = self.__shift(player, shift) & opponent
+            for _ in range(self.__max_run - 1):
+                run |= self.__shift(run, shift) & opponent
+            moves |= self.__shift(run, shift) & empty
+        return moves
+
+    def get_flips(self, player, opponent, moves):
+        flips = np.zeros_like(player)
+        for shift in self.__shifts:
+            run = self.__shift(moves, shift) & opponent
+            for _ in range(self.__max_run - 1):
+                run |= self.__shift(run, shift) & opponent
+            capped = self.__shift(run, shift) & player
+            flips |= np.where(capped != 0, run, np.uint64(0))
+        return flips
+
+    def make_moves(self, player, opponent, moves):
+        """Plays single-bit moves on every board. Boards with move equal to 0 stay unchanged.
+
+        Returns flipped discs together with player and opponent masks after the move.
+        """
+        flips = self.get_flips(player, opponent, moves)
+        return flips, player | moves | flips, opponent & ~flips
+
+    def get_initial(self, count):
+        height, width = self.__size
+        center_y, center_x = height // 2 - 1, width // 2 - 1
+        top_left = 1 << (center_y * width + center_x)
+        bottom_left = 1 << ((center_y + 1) * width + center_x)
+        white = np.full(count, top_left | bottom_left << 1, dtype=np.uint64)
+        black = np.full(count, bottom_left | top_left << 1, dtype=np.uint64)
+        return white, black
+
+    def to_cells(self, masks):
+        return ((masks[:, None] >> self.__bits) & self.ONE).astype(np.int8)
+
+    def from_cells(self, cells):
+        return np.bitwise_or.reduce(cells.astype(np.uint64) << self.__bits, axis=1)
+
+    def from_indices(self, indices):
+        return np.left_shift(self.ONE, np.asarray(indices, dtype=np.uint64))
+
+    @staticmethod
+    def count(masks):
+        x = masks - ((masks >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return ((x * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int_)
+
+    @staticmethod
+    def __shift(masks, shift):
+        amount, left, mask = shift
+        if left:
+            return (masks << amount) & mask
+        return (masks >> amount) & mask
@@ -1,4 +1,4 @@
-from .board import Board, Color
+from .board import Color
 
 
 class Simulation:
@@ -16,14 +16,14 @@ class Simulation:
 
     @staticmethod
     def create_initial(size, backend):
-        board = Board.create_initial(size)
+        board = backend.board_class.create_initial(size)
         return Simulation(board, Color.BLACK, backend)
 
     @staticmethod
     def create_from_number(size, number, backend):
         turn_bit = number & 1
         board_number = number >> 1
-        board = Board.create_from_number(board_number, size)
+        board = backend.board_class.create_from_number(board_number, size)
         turn = Color.BLACK if turn_bit == 1 else Color.WHITE
         return Simulation(board, turn, backend)
 
@@ -48,7 +48,7 @@ class Simulation:
         return Simulation(self.board.copy(), self.turn, self.__backend)
 
     def reset(self):
-        self.board = Board.create_initial(self.board.size)
+        self.board = type(self.board).create_initial(self.board.size)
         self.turn = Color.BLACK
 
     def get_moves(self):
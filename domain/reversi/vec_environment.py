@@ -0,0 +1,130 @@
+import random
+
+import numpy as np
+
+from .board import Color
+from .kernel import MoveKernel
+
+
+class VecReversiEnv:
+    """Runs many independent ReversiEnv games at once.
+
+    Games are kept as uint64 masks of agent and opponent discs and advanced together
+    with MoveKernel. Observations, legal-move masking, tie-breaking and random opponent
+    replies follow ReversiEnv, so a game seeded the same way is played identically.
+    """
+
+    def __init__(self, size, n_envs, autoreset=True):
+        self.__size = tuple(size)
+        self.__n_envs = n_envs
+        self.__autoreset = autoreset
+        self.__kernel = MoveKernel(self.__size)
+        self.__rngs = [random] * n_envs
+        self.__own = np.zeros(n_envs, dtype=np.uint64)
+        self.__opponent = np.zeros(n_envs, dtype=np.uint64)
+        self.__color = np.zeros(n_envs, dtype=np.int_)
+        self.__done = np.ones(n_envs, dtype=bool)
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def n_envs(self):
+        return self.__n_envs
+
+    @property
+    def done(self):
+        return np.array(self.__done)
+
+    @property
+    def masks(self):
+        return np.array(self.__own), np.array(self.__opponent)
+
+    def seed(self, seeds=None):
+        if seeds is None:
+            self.__rngs = [random] * self.__n_envs
+        else:
+            assert len(seeds) == self.__n_envs
+            self.__rngs = [random.Random(seed) for seed in seeds]
+
+    def reset(self):
+        self.__reset_games(np.arange(self.__n_envs))
+        return self.__get_states()
+
+    def step(self, nn_predictions):
+        nn_predictions = np.reshape(nn_predictions, (self.__n_envs, self.__kernel.cells))
+        rewards = np.zeros(self.__n_envs)
+        dones = np.array(self.__done)
+        infos = [{} for _ in range(self.__n_envs)]
+
+        games = np.flatnonzero(~self.__done)
+        if len(games) > 0:
+            legal_moves = self.get_legal_moves()[games]
+            moves_values = np.where(legal_moves, nn_predictions[games], -np.inf)
+            best_values = np.max(moves_values, axis=1)
+            best_moves = (moves_values == best_values[:, None]) & legal_moves
+            actions = [self.__rngs[game].choice(np.flatnonzero(moves)) for game, moves in zip(games, best_moves)]
+
+            _, self.__own[games], self.__opponent[games] = self.__kernel.make_moves(
+                self.__own[games], self.__opponent[games], self.__kernel.from_indices(actions))
+
+            own_moves = self.__kernel.get_legal_moves(self.__own[games], self.__opponent[games])
+            opponent_moves = self.__kernel.get_legal_moves(self.__opponent[games], self.__own[games])
+            self.__done[games] = (own_moves == 0) & (opponent_moves == 0)
+            self.__move_opponent(games[opponent_moves != 0])
+
+            finished = games[self.__done[games]]
+            rewards[finished] = self.__kernel.count(self.__own[finished]) - \
+                self.__kernel.count(self.__opponent[finished])
+            dones[finished] = True
+
+        states = self.__get_states()
+        if self.__autoreset:
+            finished = np.flatnonzero(self.__done)
+            for game in finished:
+                infos[game]['terminal_observation'] = states[game]
+            self.__reset_games(finished)
+            states[finished] = self.__get_states()[finished]
+
+        return states, rewards, dones, infos
+
+    def get_legal_moves(self):
+        moves = self.__kernel.get_legal_moves(self.__own, self.__opponent)
+        moves[self.__done] = 0
+        return self.__kernel.to_cells(moves).astype(bool)
+
+    def close(self):
+        pass
+
+    def __reset_games(self, games):
+        if len(games) == 0:
+            return
+        colors = [self.__rngs[game].choice([Color.WHITE, Color.BLACK]) for game in games]
+        self.__color[games] = colors
+
+        white, black = self.__kernel.get_initial(len(games))
+        is_white = self.__color[games] == Color.WHITE
+        self.__own[games] = np.where(is_white, white, black)
+        self.__opponent[games] = np.where(is_white, black, white)
+        self.__done[games] = False
+
+        # Black starts, so the opponent moves first in games where the agent plays white
+        self.__move_opponent(games[is_white])
+
+    def __move_opponent(self, games):
+        while len(games) > 0:
+            moves = self.__kernel.get_legal_moves(self.__opponent[games], self.__own[games])
+            moves = self.__kernel.to_cells(moves)
+            actions = [self.__rngs[game].choice(np.flatnonzero(game_moves)) for game, game_moves in zip(games, moves)]
+
+            _, self.__opponent[games], self.__own[games] = self.__kernel.make_moves(
+                self.__opponent[games], self.__own[games], self.__kernel.from_indices(actions))
+
+            own_moves = self.__kernel.get_legal_moves(self.__own[games], self.__opponent[games])
+            opponent_moves = self.__kernel.get_legal_moves(self.__opponent[games], self.__own[games])
+            self.__done[games] = (own_moves == 0) & (opponent_moves == 0)
+            games = games[(own_moves == 0) & (opponent_moves != 0)]
+
+    def __get_states(self):
+        return self.__kernel.to_cells(self.__own) - self.__kernel.to_cells(self.__opponent)
@@ -0,0 +1,131 @@
+"""Time the serial (master) part of WANN evolution.
+
+Fitness is random, so only ranking, speciation, recombination, mutation and
+expression of children are measured -- the work done by the master between
+two batches of evaluations. Memory held by each individual of the final
+population is reported as well, and with hyp['alg_memoSize'] the share of
+network calls saved by the output memo when some of them are played.
+
+"""
+
+import numpy as np
+import argparse
+import random
+import time
+import sys
+
+from wann_src import *
+from domain import *
+
+def benchGen(hyp, popSize, nGen, nWarmup, seed):
+  """Returns master side time of each generation
+
+  Args:
+    hyp     - (dict) - algorithm hyperparameters
+    popSize - (int)  - population size
+    nGen    - (int)  - number of timed generations
+    nWarmup - (int)  - generations evolved before timing (networks grow)
+    seed    - (int)  - random seed
+
+  Returns:
+    genTime - (np_array) - seconds spent in ask and tell of each generation
+              [nGen X 1]
+    pop     - [Ind]      - final population
+  """
+  np.random.seed(seed)
+  random.seed(seed)
+  hyp = dict(hyp)
+  hyp['popSize'] = popSize
+  alg = Wann(hyp)
+
+  genTime = np.zeros(nGen)
+  for gen in range(nWarmup+nGen):
+    tStart = time.perf_counter()
+    pop = alg.ask()
+    alg.tell(np.random.rand(len(pop), hyp['alg_nVals']))
+    if gen >= nWarmup:
+      genTime[gen-nWarmup] = time.perf_counter() - tStart
+  return genTime, alg.pop
+
+def nBytes(obj, seen):
+  """Returns bytes of all arrays in (nested tuples/lists of) obj, arrays 
+  already in seen (shared by several attributes) are counted once
+  """
+  if isinstance(obj, np.ndarray) and id(obj) not in seen:
+    seen.add(id(obj))
+    return obj.nbytes
+  if isinstance(obj, (tuple, list)):
+    return sum([nBytes(item, seen) for item in obj])
+  return 0
+
+def indBytes(ind):
+  """Returns bytes held by individual: object and all of its arrays
+  """
+  seen = set()
+  return sys.getsizeof(ind) + sum([nBytes(getattr(ind, slot, None), seen) \
+                                   for slot in type(ind).__slots__])
+
+def denseBytes(ind):
+  """Returns bytes the same individual took as float64 genes plus dense wMat
+  and wVec copy of the expressed network, as individuals were stored before
+  """
+  nNode = len(ind.aVec)
+  genes = 8 * (5*np.shape(ind.connKey)[1] + 3*np.shape(ind.node)[1])
+  return genes + 8 * (2*nNode**2 + nNode)
+
+def benchMemo(hyp, pop, nInd, seed):
+  """Returns share of network calls answered by the output memo when nInd
+  individuals are played serially (see Task.actMemo)
+  """
+  task = Task(games[hyp['task']], nReps=hyp['alg_nReps'])
+  hyp = dict(hyp)
+  hyp['alg_lockstep'] = False
+  for ind in pop[:nInd]:
+    task.getDistFitness(ind.wEdge, ind.aVec, hyp, seed=seed, \
+                        nVals=hyp['alg_nVals'])
+  nCall, nHit = task.memoCount
+  return nHit / max(1, nCall)
+
+def main(argv):
+  hyp = loadHyp(pFileName=args.default)
+  updateHyp(hyp,args.hyperparam)
+
+  print('\t*** Task:', hyp['task'], '\t***')
+  for popSize in args.popSize:
+    genTime, pop = benchGen(hyp, popSize, args.nGen, args.nWarmup, args.seed)
+    print('popSize {:5d} \t|---| {:.3f} s/gen (median {:.3f}, {} gens)'.format(\
+          popSize, np.mean(genTime), np.median(genTime), args.nGen))
+    print('\t\t|---| {:.1f} kB/ind (dense float64 layout: {:.1f} kB/ind)'.format(\
+          np.mean([indBytes(ind) for ind in pop])/1e3, \
+          np.mean([denseBytes(ind) for ind in pop])/1e3))
+    if hyp['alg_memoSize'] > 0:
+      print('\t\t|---| {:.1%} of network calls from memo ({} individuals)'.format(\
+            benchMemo(hyp, pop, args.nMemo, args.seed), args.nMemo))
+
+if __name__ == "__main__":
+  ''' Parse input and launch '''
+  parser = argparse.ArgumentParser(description=('Time master side of WANN'))
+
+  parser.add_argument('-d', '--default', type=str,\
+   help='default hyperparameter file', default='p/default_wan.json')
+
+  parser.add_argument('-p', '--hyperparam', type=str,\
+   help='hyperparameter file', default='p/reversi_8_8.json')
+
+  parser.add_argument('--popSize', type=int, nargs='+',\
+   help='population sizes to time', default=[192, 1000])
+
+  parser.add_argument('-g', '--nGen', type=int,\
+   help='number of timed generations', default=5)
+
+  parser.add_argument('-w', '--nWarmup', type=int,\
+   help='generations evolved before timing', default=20)
+
+  parser.add_argument('-m', '--nMemo', type=int,\
+   help='individuals played to measure output memo', default=8)
+
+  parser.add_argument('-s', '--seed', type=int,\
+   help='random seed', default=0)
+
+  args = parser.parse_args()
+  main(args)
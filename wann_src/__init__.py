@@ -1,4 +1,7 @@
 from .wann import *
 from .dataGatherer import *
 from .task import *
-from .ind import *
\ No newline at end of file
+from .ind import *
+from .cache import *
+from .archive import *
+from .innov import *
\ No newline at end of file
@@ -1,10 +1,11 @@
 # -- Species container for population ------------------------------------ -- #
 """
-In WANNs we aren't using species (for simplicity -- nothing forbids 
-their use) but the code was adapted from the prettyNEAT package, whose 
-operators act on a population in Species class containers. So here we 
-dump the entire population into a Species.
+In WANNs species aren't used by default (for simplicity -- nothing forbids
+their use), the code was adapted from the prettyNEAT package, whose
+operators act on a population in Species class containers. Without
+speciation the entire population is dumped into a single Species.
 """
+import numpy as np
 
 
 class Species():
@@ -30,14 +31,213 @@ class Species():
     self.lastImp = 0
     self.nOffspring = []
 
-def speciate(self):  
+def speciate(self):
   """Divides population into species and assigns each a number of offspring
 
-  NOTE: In WANNs we aren't using speciation -- so we just put all individuals
-  in the same species, this is to just to fit things into the prettyNEAT code
+  With hyp['alg_speciate'] == "none" all individuals are put in the same
+  species, just to fit things into the prettyNEAT code. With "neat" the
+  compatibility threshold is first moved toward the target number of
+  species, then individuals are assigned to species (see assignSpecies) and
+  offspring shared between them by fitness (see assignOffspring).
   """
-  self.species = [Species(self.pop[0])]
-  self.species[0].nOffspring = self.p['popSize']
-  for ind in self.pop:
-    ind.species = 0
-  self.species[0].members = self.pop
+  p = self.p
+  if p['alg_speciate'] == 'neat':
+    # Adjust species threshold to track desired number of species
+    if len(self.species) > p['spec_target']: # Increase threshold
+      self.specThresh += p['spec_compatMod']
+    if len(self.species) < p['spec_target']: # Decrease threshold
+      self.specThresh -= p['spec_compatMod']
+    self.specThresh = max(self.specThresh, p['spec_threshMin'])
+
+    self.species = self.assignSpecies(self.species, self.pop)
+    self.species = self.assignOffspring(self.species, self.pop)
+  else:
+    self.species = [Species(self.pop[0])]
+    self.species[0].nOffspring = p['popSize']
+    for ind in self.pop:
+      ind.species = 0
+    self.species[0].members = self.pop
+
+def assignSpecies(self, species, pop):
+  """Assigns each individual to the first species whose seed is within the
+  compatibility threshold, or makes it the seed of a new species
+  Distances to all seeds, old and new, are taken from a single distance
+  matrix of seeds and population (see compatDistMat).
+
+  Args:
+    species - [Species] - species of last generation
+    pop     - [Ind]     - population to divide
+
+  Returns:
+    species - [Species] - species with their new members, species without
+                          members are dropped later (see assignOffspring)
+  """
+  p = self.p
+  seeds = [s.seed for s in species]
+  dist = compatDistMat(seeds + pop, p['spec_geneCoef'], p['spec_actCoef'])
+
+  # Row of dist each species is anchored by
+  anchor = list(range(len(seeds)))
+  for s in species:
+    s.members = []
+
+  for i, ind in enumerate(pop):
+    row = len(seeds) + i
+    close = np.flatnonzero(dist[row, anchor] < self.specThresh)
+    if len(close) > 0:
+      ind.species = int(close[0])
+      species[ind.species].members.append(ind)
+    else: # If no seed is close enough, start your own species
+      ind.species = len(species)
+      species.append(Species(ind))
+      anchor.append(row)
+  return species
+
+def assignOffspring(self, species, pop):
+  """Shares offspring of next generation between species
+  Each species gets offspring in proportion to the mean rank score of its
+  members (fitness sharing), species which haven't improved their best
+  fitness for hyp['spec_dropOffAge'] generations get none, unless they hold
+  the best ranked individual. Species without offspring go extinct.
+
+  Args:
+    species - [Species] - species with members (see assignSpecies)
+    pop     - [Ind]     - ranked population (see probMoo)
+
+  Returns:
+    species - [Species] - surviving species, with new seeds and number of
+                          offspring
+  """
+  p = self.p
+  nInd = len(pop)
+  speciesFit = np.zeros(len(species))
+  for iSpec, s in enumerate(species):
+    if len(s.members) == 0:
+      continue
+    # Linear rank score: best individual nInd, worst 1
+    rankScore = nInd - np.array([ind.rank for ind in s.members])
+    speciesFit[iSpec] = np.mean(rankScore)
+
+    # Did the species improve?
+    fit = np.array([ind.fitness for ind in s.members])
+    if np.max(fit) > s.bestFit:
+      s.bestFit = np.max(fit)
+      s.bestInd = s.members[np.argmax(fit)]
+      s.lastImp = 0
+    else:
+      s.lastImp += 1
+
+    # Stagnant species don't receive species fitness
+    if s.lastImp > p['spec_dropOffAge'] and np.max(rankScore) < nInd:
+      speciesFit[iSpec] = 0
+
+  # Assign offspring
+  if np.sum(speciesFit) == 0:
+    speciesFit = np.array([len(s.members) > 0 for s in species], dtype=float)
+  offspring = bestIntSplit(speciesFit, p['popSize'])
+  for iSpec, s in enumerate(species):
+    s.nOffspring = offspring[iSpec]
+
+  # Extinction, best ranked member becomes seed of each survivor
+  species = [s for s in species if s.nOffspring > 0]
+  for iSpec, s in enumerate(species):
+    s.seed = min(s.members, key=lambda ind: ind.rank)
+    for ind in s.members:
+      ind.species = iSpec
+  return species
+
+
+# -- Compatibility distance ---------------------------------------------- -- #
+
+def getGeneMatrix(pop):
+  """Aligns genes of all individuals by innovation number and node id
+
+  Args:
+    pop   - [Ind]      - individuals
+
+  Returns:
+    conns - (np_array) - has individual an enabled connection gene with
+            [nInd X nInnov] this innovation number? float32
+    acts  - (np_array) - activation function of each hidden or output node
+            [nInd X nNodeId] (0: individual doesn't have the node)
+  """
+  nInd = len(pop)
+  innovs = [ind.connKey[0,ind.connOn] for ind in pop]
+  nodes  = [ind.node[:,(ind.node[1,:]==2) | (ind.node[1,:]==3)] for ind in pop]
+  row = np.repeat(np.arange(nInd), [len(i) for i in innovs])
+  nodeRow = np.repeat(np.arange(nInd), [np.shape(n)[1] for n in nodes])
+  innovs = np.concatenate(innovs)
+  nodes  = np.concatenate(nodes, axis=1)
+
+  # Columns: innovation numbers and node ids present in any individual
+  # (both are running counters, most of them are long gone)
+  innovId, col = np.unique(innovs, return_inverse=True)
+  conns = np.zeros((nInd, len(innovId)), dtype=np.float32)
+  conns[row, col] = 1
+
+  nodeId, col = np.unique(nodes[0,:], return_inverse=True)
+  acts = np.zeros((nInd, len(nodeId)), dtype=np.int32)
+  acts[nodeRow, col] = nodes[2,:]
+  return conns, acts
+
+def compatDistMat(pop, geneCoef, actCoef):
+  """Returns compatibility distance of all pairs of individuals
+  The gene term is the number of disjoint and excess enabled connection
+  genes, normalized by the larger genome. In WANNs weights are shared, so
+  instead of weight differences the activation term is the share of nodes
+  found in both individuals with different activation functions. Counts of
+  all pairs are found at once as products of the aligned gene matrices (see
+  getGeneMatrix).
+
+  Args:
+    pop      - [Ind]      - individuals
+    geneCoef - (float)    - weight of disjoint and excess genes
+    actCoef  - (float)    - weight of activation mismatch
+
+  Returns:
+    dist     - (np_array) - compatibility distance
+               [nInd X nInd]
+  """
+  conns, acts = getGeneMatrix(pop)
+
+  # Disjoint and excess genes: genes of either minus genes of both
+  nGene = np.sum(conns, axis=1)
+  shared = conns @ conns.T
+  geneDiff = nGene[:,None] + nGene[None,:] - 2*shared
+  geneDiff /= np.maximum(1, np.maximum(nGene[:,None], nGene[None,:]))
+
+  # Activation mismatch of matching nodes, only nodes with more than one 
+  # activation in the population can mismatch
+  has = (acts > 0).astype(np.float32)
+  nMatch = has @ has.T
+  varied = np.max(acts, axis=0) != np.min(np.where(acts > 0, acts, np.inf), axis=0)
+  acts = acts[:, varied]
+  hasVaried = (acts > 0).astype(np.float32)
+  nDiff = hasVaried @ hasVaried.T
+  for a in np.unique(acts[acts > 0]):
+    isAct = (acts == a).astype(np.float32)
+    nDiff -= isAct @ isAct.T
+  actDiff = nDiff / np.maximum(1, nMatch)
+
+  return geneCoef*geneDiff + actCoef*actDiff
+
+def bestIntSplit(ratio, total):
+  """Divides a total into integer shares as close as possible to a ratio
+
+  Args:
+    ratio - (np_array) - relative size of each share
+            [nShares X 1]
+    total - (int)      - total to divide
+
+  Returns:
+    intSplit - (np_array) - integer shares summing to total
+               [nShares X 1]
+  """
+  floatSplit = np.asarray(ratio, dtype=float) / np.sum(ratio) * total
+  intSplit = np.floor(floatSplit).astype(int)
+
+  # Remaining units go to the largest fractional parts
+  remainder = int(total - np.sum(intSplit))
+  deserving = np.argsort(-(floatSplit-intSplit), kind='stable')
+  intSplit[deserving[:remainder]] += 1
+  return intSplit
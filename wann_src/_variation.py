@@ -1,6 +1,6 @@
 import numpy as np
 import itertools
-from .ind import Ind, getLayer, getNodeOrder
+from .ind import Ind, getNodeLayers, getNodeOrder
 
 
 def evolvePop(self):
@@ -19,35 +19,53 @@ def evolvePop(self):
 def recombine(self, species, innov, gen):
   """ Creates next generation of child solutions from a species
 
+  Procedure:
+    ) Select elites and parents (see selectParents)
+    ) Produce new population through crossover and mutation (see breed)
+
+  Args:
+      species - (Species) -
+        .members    - [Ind] - parent population
+        .nOffspring - (int) - number of children to produce
+      innov   - (InnovRecord) - innovation record
+      gen     - (int) - current generation
+
+  Returns:
+      children - [Ind]      - newly created population
+      innov   - (InnovRecord) - updated innovation record
+
+  """
+  children, parents = self.selectParents(species)
+ 
+  # Breed child population
+  for parentA, parentB in parents:
+    child, innov = self.breed(parentA, parentB, innov, gen)
+    children.append(child)      
+
+  return children, innov
+
+def selectParents(self, species):
+  """ Selects elites and parent pairs of the next generation of a species
+
   Procedure:
     ) Sort all individuals by rank
     ) Eliminate lower percentage of individuals from breeding pool
     ) Pass upper percentage of individuals to child population unchanged
     ) Select parents by tournament selection
-    ) Produce new population through crossover and mutation
 
   Args:
       species - (Species) -
         .members    - [Ind] - parent population
         .nOffspring - (int) - number of children to produce
-      innov   - (np_array)  - innovation record
-                [5 X nUniqueGenes]
-                [0,:] == Innovation Number
-                [1,:] == Source
-                [2,:] == Destination
-                [3,:] == New Node?
-                [4,:] == Generation evolved
-      gen     - (int) - current generation
 
   Returns:
-      children - [Ind]      - newly created population
-      innov   - (np_array)  - updated innovation record
-
+      elites  - [Ind]        - individuals passed on unchanged
+      parents - [(Ind, Ind)] - parents of each child, fitter parent first
   """
   p = self.p
   nOffspring = int(species.nOffspring)
   pop = species.members
-  children = []
+  elites = []
  
   # Sort by rank
   pop.sort(key=lambda x: x.rank)
@@ -57,10 +75,11 @@ def recombine(self, species, innov, gen):
   if numberToCull > 0:
     pop[-numberToCull:] = []     
 
-  # Elitism - keep best individuals unchanged
+  # Elitism - keep best individuals unchanged (no more than offspring given)
   nElites = int(np.floor(len(pop)*p['select_eliteRatio']))
+  nElites = min(nElites, nOffspring)
   for i in range(nElites):
-    children.append(pop[i])
+    elites.append(pop[i])
     nOffspring -= 1
 
   # Get parent pairs via tournament selection
@@ -70,23 +89,68 @@ def recombine(self, species, innov, gen):
   parentB = np.random.randint(len(pop),size=(nOffspring,p['select_tournSize']))
   parents = np.vstack( (np.min(parentA,1), np.min(parentB,1) ) )
   parents = np.sort(parents,axis=0) # Higher fitness parent first    
-  
-  # Breed child population
-  for i in range(nOffspring):  
-    if np.random.rand() > p['prob_crossover']:
-      # Mutation only: take only highest fit parent
-      child = Ind(pop[parents[0,i]].conn,\
-                  pop[parents[0,i]].node)
-    else:
-      # Crossover
-      child = self.crossover(pop[parents[0,i]], pop[parents[1,i]])
-      
-    child, innov = self.topoMutate(child,innov,gen)    
 
-    child.express()
-    children.append(child)      
+  return elites, [(pop[parents[0,i]], pop[parents[1,i]]) \
+                  for i in range(nOffspring)]
 
-  return children, innov
+def breed(self, parentA, parentB, innov, gen):
+  """ Creates and expresses a single child
+
+  Args:
+      parentA - (Ind)       - fitter parent
+      parentB - (Ind)       - other parent, only used in crossover
+      innov   - (InnovRecord) - innovation record
+      gen     - (int)       - current generation
+
+  Returns:
+      child   - (Ind)       - newly created individual
+      innov   - (InnovRecord) - updated innovation record
+  """
+  if np.random.rand() > self.p['prob_crossover']:
+    # Mutation only: take only highest fit parent
+    child = Ind(parentA.conn, parentA.node)
+    child.topo = parentA.topo
+  else:
+    # Crossover
+    child = self.crossover(parentA, parentB)
+    
+  child, innov = self.topoMutate(child,innov,gen)    
+
+  child.express()
+  return child, innov
+
+def breedJobs(self):
+  """ Selects parents of the next generation to be bred elsewhere
+  Each child gets its own record drawing from a block of 2 innovation 
+  numbers and 1 node id, enough for any single topological mutation, and a
+  random seed. Children can then be bred in any order or process (see 
+  breedJob), their records are merged in job order (see setPop), where 
+  children repeating an innovation get the ids of its first occurrence.
+
+  Returns:
+      elites  - [Ind]   - individuals passed on unchanged
+      jobs    - [tuple] - (parentA, parentB, innov, gen, seed) of each child
+  """
+  elites, jobs = [], []
+  for species in self.species:
+    speciesElites, parents = self.selectParents(species)
+    elites += speciesElites
+    for parentA, parentB in parents:
+      innov = self.innov.reserve(2, 1)
+      seed = np.random.randint(2**31-1)
+      jobs.append((parentA, parentB, innov, self.gen, seed))
+  return elites, jobs
+
+def breedJob(self, job):
+  """ Breeds child of a job created by breedJobs
+
+  Returns:
+      child   - (Ind)         - newly created individual
+      innov   - (InnovRecord) - innovations of the child
+  """
+  parentA, parentB, innov, gen, seed = job
+  np.random.seed(seed)
+  return self.breed(parentA, parentB, innov, gen)
 
 
 # -- Canonical NEAT recombination operators ------------------------------ -- #
@@ -125,7 +189,9 @@ def crossover(self,parentA, parentB):
   # Replace weights with parentB weights with some probability
   bProb = 0.5
   bGenes = np.random.rand(1,len(matching))<bProb
-  child.conn[3,IA[bGenes[0]]] = parentB.conn[3,IB[bGenes[0]]]
+  child.connW[IA[bGenes[0]]] = parentB.connW[IB[bGenes[0]]]
+  if np.array_equal(child.connW, parentA.connW):
+    child.topo = parentA.topo # Same network as parent
   
   return child
 
@@ -145,23 +211,16 @@ def mutAddNode(self, connG, nodeG, innov, gen):
                [0,:] == Node Id
                [1,:] == Type (1=input, 2=output 3=hidden 4=bias)
                [2,:] == Activation function (as int)
-    innov    - (np_array) - innovation record
-               [5 X nUniqueGenes]
-               [0,:] == Innovation Number
-               [1,:] == Source
-               [2,:] == Destination
-               [3,:] == New Node?
-               [4,:] == Generation evolved
+    innov    - (InnovRecord) - innovation record
     gen      - (int) - current generation
 
   Returns:
     connG    - (np_array) - updated connection genes
     nodeG    - (np_array) - updated node genes
-    innov    - (np_array) - updated innovation record
+    innov    - (InnovRecord) - updated innovation record
 
   """
   p = self.p
-  nextInnovNum = innov[0,-1]+1
      
   # Choose connection to split
   connActive = np.where(connG[4,:] == 1)[0]
@@ -169,9 +228,11 @@ def mutAddNode(self, connG, nodeG, innov, gen):
     return connG, nodeG, innov # No active connections, nothing to split
   connSplit  = connActive[np.random.randint(len(connActive))]
   
-  # Create new node
+  # Create new node -- splitting the same connection again in this generation
+  # gives the same node id and innovation numbers (unless already in genome)
   newActivation = p['ann_actRange'][np.random.randint(len(p['ann_actRange']))]
-  newNodeId = int(max(innov[2,:])+1) # next node id is a running counter
+  innovTo, innovFrom, newNodeId = innov.addNode(connG[1,connSplit],\
+                                   connG[2,connSplit], gen, nodes=nodeG[0,:])
   newNode = np.array([[newNodeId, 3, newActivation]]).T
   
   # Add connections to and from new node
@@ -181,12 +242,12 @@ def mutAddNode(self, connG, nodeG, innov, gen):
   # should be minimal.
 
   connTo    = connG[:,connSplit].copy()
-  connTo[0] = nextInnovNum
+  connTo[0] = innovTo
   connTo[2] = newNodeId
   connTo[3] = 1 # weight set to 1
     
   connFrom    = connG[:,connSplit].copy()
-  connFrom[0] = nextInnovNum + 1
+  connFrom[0] = innovFrom
   connFrom[1] = newNodeId
   connFrom[3] = connG[3,connSplit] # weight set previous weight value   
       
@@ -194,12 +255,6 @@ def mutAddNode(self, connG, nodeG, innov, gen):
       
   # Disable original connection
   connG[4,connSplit] = 0
-      
-  # Record innovations
-  newInnov = np.empty((5,2))
-  newInnov[:,0] = np.hstack((connTo[0:3], newNodeId, gen))   
-  newInnov[:,1] = np.hstack((connFrom[0:3], -1, gen)) 
-  innov = np.hstack((innov,newInnov))
   
   # Add new structures to genome
   nodeG = np.hstack((nodeG,newNode))
@@ -207,14 +262,14 @@ def mutAddNode(self, connG, nodeG, innov, gen):
   
   return connG, nodeG, innov
 
-def mutAddConn(self, connG, nodeG, innov, gen):
+def mutAddConn(self, connG, nodeG, innov, gen, topo=None):
   """Add new connection to genome.
   To avoid creating recurrent connections all nodes are first sorted into
-  layers, connections are then only created from nodes to nodes of the same or
-  later layers.
-
-
-  Todo: check for preexisting innovations to avoid duplicates in same gen
+  layers, connections are then only created from nodes to nodes of later 
+  layers. Valid targets of every node are counted at once, so the new 
+  connection is drawn directly instead of trying one source after another.
+  Adding the same connection again in this generation gives the same 
+  innovation number.
 
   Args:
     connG    - (np_array) - connection genes
@@ -229,67 +284,61 @@ def mutAddConn(self, connG, nodeG, innov, gen):
                [0,:] == Node Id
                [1,:] == Type (1=input, 2=output 3=hidden 4=bias)
                [2,:] == Activation function (as int)
-    innov    - (np_array) - innovation record
-               [5 X nUniqueGenes]
-               [0,:] == Innovation Number
-               [1,:] == Source
-               [2,:] == Destination
-               [3,:] == New Node?
-               [4,:] == Generation evolved
+    innov    - (InnovRecord) - innovation record
     gen      - (int) - current generation
 
+  Optional:
+    topo     - (tuple) - (node order, node layers) of these genes if known, 
+                         see Ind.topo
+
 
   Returns:
     connG    - (np_array) - updated connection genes
-    innov    - (np_array) - updated innovation record
+    innov    - (InnovRecord) - updated innovation record
 
   """
   nIns = len(nodeG[0,nodeG[1,:] == 1]) + len(nodeG[0,nodeG[1,:] == 4])
   nOuts = len(nodeG[0,nodeG[1,:] == 2])
-  order, wMat = getNodeOrder(nodeG, connG)   # Topological Sort of Network
-  hMat = wMat[nIns:-nOuts,nIns:-nOuts]
-  hLay = getLayer(hMat)+1
 
   # To avoid recurrent connections nodes are sorted into layers, and 
   # connections are only allowed from lower to higher layers
-  if len(hLay) > 0:
-    lastLayer = max(hLay)+1
+  if topo is None:
+    order, wMat = getNodeOrder(nodeG, connG)   # Topological Sort of Network
+    L = getNodeLayers(wMat, nIns, nOuts)
   else:
-    lastLayer = 1
-  L = np.r_[np.zeros(nIns), hLay, np.full((nOuts),lastLayer) ]
-  nodeKey = np.c_[nodeG[0,order], L] # Assign Layers
-
-  sources = np.random.permutation(len(nodeKey))
-  for src in sources:
-    srcLayer = nodeKey[src,1]
-    dest = np.where(nodeKey[:,1] > srcLayer)[0]
-    
-    # Finding already existing connections:
-    #   take all connection genes with this source (connG[1,:])
-    #   take the destination of those genes (connG[2,:])
-    #   convert to nodeKey index (gotta be a better way in numpy...)   
-    srcIndx = np.where(connG[1,:]==nodeKey[src,0])[0]
-    exist = connG[2,srcIndx]
-    existKey = []
-    for iExist in exist:
-      existKey.append(np.where(nodeKey[:,0]==iExist)[0])
-    dest = np.setdiff1d(dest,existKey) # Remove existing connections
-    
-    # Add a random valid connection
-    np.random.shuffle(dest)
-    if len(dest)>0:  # (if there is one)
-      connNew = np.empty((5,1))
-      connNew[0] = innov[0,-1]+1 # Increment innovation counter
-      connNew[1] = nodeKey[src,0]
-      connNew[2] = nodeKey[dest[0],0]
-      connNew[3] = 1
-      connNew[4] = 1
-      connG = np.c_[connG,connNew]
-
-      # Record innovation
-      newInnov = np.hstack((connNew[0:3].flatten(), -1, gen))
-      innov = np.hstack((innov,newInnov[:,None]))
-      break;
+    order, L, _ = topo
+  nodeId = nodeG[0,order].astype(int)
+  nNode = len(nodeId)
+
+  # Connection index: position of each node in order, existing connections 
+  # from lower to higher layers, and number of valid new targets of each 
+  # node (all nodes of higher layers not yet connected to)
+  pos = np.full(np.max(nodeId)+1, -1)
+  pos[nodeId] = np.arange(nNode)
+  src  = pos[connG[1,:].astype(int)]
+  dest = pos[connG[2,:].astype(int)]
+  exist = np.unique(src*nNode + dest)
+  exist = exist[L[exist//nNode] < L[exist%nNode]]
+  nLater = nNode - np.searchsorted(np.sort(L), L, side='right')
+  nFree = nLater - np.bincount(exist//nNode, minlength=nNode)
+
+  # Add a random valid connection (if there is one): source drawn from all
+  # nodes with a valid target, then destination from its valid targets
+  sources = np.flatnonzero(nFree > 0)
+  if len(sources) > 0:
+    src = sources[np.random.randint(len(sources))]
+    valid = L > L[src]
+    valid[exist[exist//nNode == src]%nNode] = False
+    dest = np.flatnonzero(valid)
+    dest = dest[np.random.randint(len(dest))]
+
+    connNew = np.empty((5,1))
+    connNew[1] = nodeId[src]
+    connNew[2] = nodeId[dest]
+    connNew[0] = innov.addConn(connNew[1,0], connNew[2,0], gen)
+    connNew[3] = 1
+    connNew[4] = 1
+    connG = np.c_[connG,connNew]
 
   return connG, innov
 
@@ -314,17 +363,11 @@ def topoMutate(self,child,innov,gen):
                [0,:] == Node Id
                [1,:] == Type (1=input, 2=output 3=hidden 4=bias)
                [2,:] == Activation function (as int)
-    innov    - (np_array) - innovation record
-               [5 X nUniqueGenes]
-               [0,:] == Innovation Number
-               [1,:] == Source
-               [2,:] == Destination
-               [3,:] == New Node?
-               [4,:] == Generation evolved
+    innov    - (InnovRecord) - innovation record
 
   Returns:
       child   - (Ind)      - newly created individual
-      innov   - (np_array) - innovation record
+      innov   - (InnovRecord) - updated innovation record
 
   """
 
@@ -348,13 +391,21 @@ def topoMutate(self,child,innov,gen):
     else:
       slot += topoRoulette[i]
 
+  # Record change, so child can be expressed without sorting it again
+  change = ('act',)
+
   # Add Connection
   if choice is 1:
-    connG, innov = self.mutAddConn(connG, nodeG, innov, gen)  
+    connG, innov = self.mutAddConn(connG, nodeG, innov, gen, child.topo)
+    if np.shape(connG)[1] > nConn:
+      change = ('conn',)
 
   # Add Node
   elif choice is 2:
     connG, nodeG, innov = self.mutAddNode(connG, nodeG, innov, gen)
+    if np.shape(connG)[1] > nConn:
+      split = np.where(connG[4,:nConn] != child.conn[4,:])[0][0]
+      change = ('node', split)
 
   # Enable Connection
   elif choice is 3:
@@ -362,6 +413,7 @@ def topoMutate(self,child,innov,gen):
     if len(disabled) > 0:
       enable = np.random.randint(len(disabled))
       connG[4,disabled[enable]] = 1
+      change = ('enable', disabled[enable])
 
   # Mutate Activation
   elif choice is 4:
@@ -375,6 +427,7 @@ def topoMutate(self,child,innov,gen):
   child.conn = connG
   child.node = nodeG
   child.birth = gen
+  child.change = change
 
   return child, innov
 
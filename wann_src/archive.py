@@ -0,0 +1,80 @@
+import numpy as np
+import copy
+from bisect import bisect_left, bisect_right
+
+
+class ParetoArchive():
+  """Non-dominated set of every individual evaluated so far, 2 objectives
+  Members are kept sorted by the first objective, on a non-dominated set
+  the second objective is then strictly decreasing. Whether a new point is
+  dominated, and the run of members it dominates, are both found by binary
+  search, so the whole history never has to be sorted again. Members are
+  copies of the individuals as they were when added: an individual evaluated
+  again later (e.g. an elite) does not change them.
+
+  NOTE: Assumes maximization of both objectives
+  """
+  def __init__(self):
+    """
+    Attributes:
+      obj0  - [float] - first objective of each member, increasing
+      neg1  - [float] - negated second objective of each member, increasing
+      ind   - [Ind]   - copy of individual of each member
+      birth - [int]   - generation each member was evaluated in
+    """
+    self.obj0  = []
+    self.neg1  = []
+    self.ind   = []
+    self.birth = []
+
+  def __len__(self):
+    return len(self.ind)
+
+  def insert(self, obj0, obj1, ind=None, gen=0):
+    """Adds point unless an equal or dominating member exists, members it
+    dominates are evicted
+
+    Args:
+      obj0 - (float) - first objective
+      obj1 - (float) - second objective
+      ind  - (Ind)   - individual the objectives belong to, a copy is kept
+      gen  - (int)   - generation of evaluation
+
+    Returns:
+      added - (bool) - was point added to archive?
+    """
+    # Member with the smallest obj0 >= new one has the largest obj1 of them
+    i = bisect_left(self.obj0, obj0)
+    if i < len(self.obj0) and -self.neg1[i] >= obj1:
+      return False
+
+    # Dominated members: obj0 <= new one and obj1 <= new one (a single run)
+    end = bisect_right(self.obj0, obj0)
+    start = bisect_left(self.neg1, -obj1, 0, end)
+    self.obj0[start:end]  = [obj0]
+    self.neg1[start:end]  = [-obj1]
+    self.ind[start:end]   = [copy.deepcopy(ind)]
+    self.birth[start:end] = [gen]
+    return True
+
+  def update(self, pop, gen=0):
+    """Inserts fitness and connection count of each individual, fewer
+    connections are better (see Wann.probMoo)
+
+    Args:
+      pop - [Ind] - evaluated individuals
+      gen - (int) - generation of evaluation
+
+    Returns:
+      nAdded - (int) - number of individuals added
+    """
+    return sum([self.insert(ind.fitness, -ind.nConn, ind, gen) for ind in pop])
+
+  def objVals(self):
+    """Returns objectives and generation of every member
+
+    Returns:
+      objVals - (np_array) - [obj0, obj1, generation] of each member
+                [nMembers X 3]
+    """
+    return np.c_[self.obj0, -np.array(self.neg1), self.birth]
@@ -0,0 +1,133 @@
+import numpy as np
+from collections import OrderedDict
+
+from domain import games
+from .task import Task
+
+
+class FitCache():
+  """Bounded store of evaluation results, kept across generations
+  Results are keyed by task, seed policy and canonical hash of the network
+  (see Ind.hash), so elites and children identical to an earlier network are
+  not sent to the workers again. Least recently used results are dropped
+  first once the cache is full.
+
+  Given a probe set, networks are instead keyed by the moves they pick on 
+  it (see Task.getFingerprint): structurally different networks playing 
+  the same way share one result.
+  """
+  def __init__(self, hyp):
+    """
+    Args:
+      hyp - (dict) - algorithm hyperparameters
+        ['alg_cacheSize']   - (int)    - results kept (0: no cache)
+        ['alg_cachePolicy'] - (string) - "reuse": seen networks are not
+                                         evaluated again
+                                         "resample": seen networks are
+                                         evaluated again, their mean over
+                                         all evaluations is returned
+        ['alg_probeSize']   - (int)    - positions in probe set (0: key by
+                                         network hash, Reversi only)
+
+    Attributes:
+      size    - (int)         - maximum number of results kept
+      policy  - (string)      - see above
+      task    - (string)      - name of task
+      entries - (OrderedDict) - key -> [summed reward, number of samples]
+      hits    - [[int]]       - individuals looked up and individuals not
+                                sent for evaluation, for each lookup
+      probeTask - (Task)      - task the probe set is drawn from
+      probes  - (tuple)       - probe positions (see Task.getProbeSet)
+      prints  - (OrderedDict) - network hash -> fingerprint
+    """
+    self.p       = hyp
+    self.size    = hyp['alg_cacheSize']
+    self.policy  = hyp['alg_cachePolicy']
+    self.task    = hyp['task']
+    self.entries = OrderedDict()
+    self.hits    = []
+    self.probes  = None
+    self.prints  = OrderedDict()
+    if self.size > 0 and hyp['alg_probeSize'] > 0:
+      self.probeTask = Task(games[self.task], paramOnly=True)
+      self.probes = self.probeTask.getProbeSet(hyp['alg_probeSize'])
+
+  def keys(self, pop, sameSeed=True):
+    """Returns cache key of each individual
+    """
+    if self.probes is None:
+      return [(self.task, sameSeed, ind.hash()) for ind in pop]
+    return [(self.task, sameSeed, self.fingerprint(ind)) for ind in pop]
+
+  def fingerprint(self, ind):
+    """Returns fingerprint of individual on the probe set, networks with the 
+    same hash are only run once
+    """
+    key = ind.hash()
+    if key not in self.prints:
+      self.prints[key] = self.probeTask.getFingerprint(ind.wEdge, ind.aVec,\
+                           self.p, self.probes, nVals=self.p['alg_nVals'])
+      if len(self.prints) > self.size:
+        self.prints.popitem(last=False)
+    return self.prints[key]
+
+  def lookup(self, keys):
+    """Finds individuals which have to be evaluated
+
+    Args:
+      keys   - [tuple]    - cache key of each individual (see keys)
+
+    Returns:
+      jobs   - [int]      - index of first individual with each key that has
+                            to be evaluated
+    """
+    jobs, seen = [], set()
+    for i, key in enumerate(keys):
+      if key in seen:
+        continue
+      seen.add(key)
+      if self.policy == 'resample' or key not in self.entries:
+        jobs.append(i)
+    self.hits.append([len(keys), len(keys) - len(jobs)])
+    return jobs
+
+  def update(self, keys, jobs, jobReward):
+    """Stores results of evaluated individuals and returns reward of all
+
+    Args:
+      keys      - [tuple]    - cache key of each individual (see keys)
+      jobs      - [int]      - index of evaluated individuals (see lookup)
+      jobReward - (np_array) - fitness values of evaluated individuals
+                  [nJobs X nVals]
+
+    Returns:
+      reward    - (np_array) - fitness value of each individual
+                  [nKeys X nVals]
+    """
+    # Results of this batch are read before anything can be evicted
+    result = {}
+    for key in set(keys):
+      if key in self.entries:
+        result[key] = self.entries[key]
+    for i, job in enumerate(jobs):
+      key = keys[job]
+      if key not in result:
+        result[key] = [jobReward[i,:], 1]
+      elif self.policy == 'resample': # (with "reuse" the first result stays)
+        total, n = result[key]
+        result[key] = [total + jobReward[i,:], n + 1]
+
+    reward = np.array([result[key][0]/result[key][1] for key in keys])
+    reward = np.reshape(reward, (len(keys), np.shape(jobReward)[1]))
+    for key in keys:
+      self.entries[key] = result[key]
+      self.entries.move_to_end(key)
+    while len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+    return reward
+
+  def hitRate(self, nLast=1):
+    """Returns share of individuals not evaluated in the last nLast lookups
+    """
+    nLookup, nHit = np.sum(self.hits[-nLast:], axis=0) if self.hits else (0,0)
+    return nHit / max(1, nLookup)
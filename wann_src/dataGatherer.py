@@ -20,7 +20,7 @@ class DataGatherer():
     self.bestFitVec = []
     self.spec_fit = []
     self.field = ['x_scale','fit_med','fit_max','fit_top','fit_peak',\
-                  'node_med','conn_med',\
+                  'node_med','conn_med','prune_node_med','prune_conn_med',\
                   'elite','best']
                   
     self.objVals = np.array([])
@@ -30,13 +30,25 @@ class DataGatherer():
       #e.g. self.fit_max   = np.array([]) 
 
     self.newBest = False
+    self.archive = None
+
+  def gatherData(self, pop, species, archive=None):
+    """
+    Args:
+      pop     - [Ind]           - evaluated population
+      species - [Species]       - current species
+      archive - (ParetoArchive) - non-dominated individuals so far, saved
+                                  with the other results if given
+    """
+    self.archive = archive
 
-  def gatherData(self, pop, species):
     # Readability
     fitness = [ind.fitness for ind in pop]
     peakfit = [ind.fitMax for ind in pop]
     nodes = np.asarray([np.shape(ind.node)[1] for ind in pop])
     conns = np.asarray([ind.nConn for ind in pop])
+    pruneNodes = np.asarray([ind.nodePruned for ind in pop])
+    pruneConns = np.asarray([ind.connPruned for ind in pop])
     
     # --- Evaluation Scale ---------------------------------------------------
     if len(self.x_scale) is 0:
@@ -62,6 +74,8 @@ class DataGatherer():
     # --- Generation fit/complexity stats ------------------------------------ 
     self.node_med = np.append(self.node_med,np.median(nodes))
     self.conn_med = np.append(self.conn_med,np.median(conns))
+    self.prune_node_med = np.append(self.prune_node_med,np.median(pruneNodes))
+    self.prune_conn_med = np.append(self.prune_conn_med,np.median(pruneConns))
     self.fit_med  = np.append(self.fit_med, np.median(fitness))
     self.fit_max  = np.append(self.fit_max,  self.elite[-1].fitness)
     self.fit_top  = np.append(self.fit_top,  self.best[-1].fitness)
@@ -89,7 +103,7 @@ class DataGatherer():
     # --- Generation fit/complexity stats ------------------------------------ 
     gStatLabel = ['x_scale',\
                   'fit_med','fit_max','fit_top','fit_peak',\
-                  'node_med','conn_med']
+                  'node_med','conn_med','prune_node_med','prune_conn_med']
     genStats = np.empty((len(self.x_scale),0))
     for i in range(len(gStatLabel)):
       #e.g.         self.    fit_max          [:,None]
@@ -113,6 +127,8 @@ class DataGatherer():
 
     # --- MOO Fronts ---------------------------------------------------------
     lsave(pref + '_objVals.out',self.objVals)
+    if self.archive is not None:
+      lsave(pref + '_archive.out',self.archive.objVals())
     # ------------------------------------------------------------------------
 
   def savePop(self,pop,filename):
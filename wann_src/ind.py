@@ -1,4 +1,5 @@
 import numpy as np
+import hashlib
 import copy
 
 
@@ -6,7 +7,14 @@ import copy
 
 class Ind():
   """Individual class: genes, network, and fitness
+  Genes are kept in narrow dtypes and the expressed network as an edge list,
+  dense matrices are only built when asked for (see wMat, wVec).
   """ 
+  __slots__ = ('node', 'connKey', 'connW', 'connOn', 'nInput', 'nOutput',\
+               'aVec', 'wEdge', 'nConn', 'nodePruned', 'connPruned', 'topo',\
+               'change', 'netHash', 'fitness', 'fitMax', 'rank', 'birth',\
+               'species')
+
   def __init__(self, conn, node):
     """Intialize individual with given genes
     Args:
@@ -22,55 +30,147 @@ class Ind():
              [2,:] == Activation function (as int)
   
     Attributes:
-      node    - (np_array) - node genes (see args)
-      conn    - (np_array) - conn genes (see args)
+      node    - (np_array) - node genes (see args), int32
+      conn    - (np_array) - conn genes (see args), assembled on access and
+                             read only, assign a new array to change genes
+      connKey - (np_array) - innovation, source and destination, int32
+                [3 X nUniqueGenes]
+      connW   - (np_array) - weight of each connection
+                [nUniqueGenes X 1]
+      connOn  - (np_array) - enabled flag of each connection, bool
+                [nUniqueGenes X 1]
       nInput  - (int)      - number of inputs
       nOutput - (int)      - number of outputs
       wMat    - (np_array) - weight matrix, one row and column for each node
                 [N X N]    - rows: connection from; cols: connection to
-      wVec    - (np_array) - wMat as a flattened vector
+                             (built from wEdge on access)
+      wVec    - (np_array) - wMat as a flattened vector (built on access)
                 [N**2 X 1]    
+      wEdge   - (np_array) - expressed network as an edge list (see 
+                [3 X nConn]  getEdgeList)
       aVec    - (np_array) - activation function of each node (as int)
                 [N X 1]    
       nConn   - (int)      - number of connections
+      nodePruned - (int)   - nodes dropped from expressed network
+      connPruned - (int)   - connections dropped from expressed network
+      topo    - (tuple)    - (node order, layer of each ordered node, edge 
+                             list of full ordered weight matrix) of the genes
+      change  - (tuple)    - single mutation since topo was computed, lets 
+                             express update topo instead of rebuilding it
+                             (see updateNodeOrder)
+      netHash - (string)   - canonical hash of expressed network, computed 
+                             on first call to hash()
       fitness - (double)   - fitness averaged over all trials (higher better)
       X fitMax  - (double)   - best fitness over all trials (higher better)
       rank    - (int)      - rank in population (lower better)
       birth   - (int)      - generation born
       species - (int)      - ID of species
     """
-    self.node    = np.copy(node)
-    self.conn    = np.copy(conn)
-    self.nInput  = sum(node[1,:]==1)
-    self.nOutput = sum(node[1,:]==2)
-    self.wMat    = []
+    self.node    = np.array(node, dtype=np.int32)
+    self.conn    = conn
+    self.nInput  = int(np.sum(self.node[1,:]==1))
+    self.nOutput = int(np.sum(self.node[1,:]==2))
+    self.wEdge   = None
     self.aVec    = []
     self.nConn   = []
+    self.nodePruned = 0
+    self.connPruned = 0
+    self.topo    = None
+    self.change  = None
+    self.netHash = None
     self.fitness = [] # Mean fitness over trials
     self.fitMax  = [] # Best fitness over trials
     self.rank    = []
     self.birth   = []
     self.species = []
 
+  @property
+  def conn(self):
+    conn = np.vstack((self.connKey, self.connW, self.connOn)).astype(np.float64)
+    conn.flags.writeable = False
+    return conn
+
+  @conn.setter
+  def conn(self, conn):
+    self.connKey = np.array(conn[0:3,:], dtype=np.int32)
+    self.connW   = np.array(conn[3,:], dtype=np.float64)
+    self.connOn  = np.array(conn[4,:], dtype=bool)
+
+  @property
+  def wMat(self):
+    if self.wEdge is None:
+      return []
+    return getWeightMat(self.wEdge, len(self.aVec))
+
+  @property
+  def wVec(self):
+    wVec = self.wMat.flatten()
+    wVec[np.isnan(wVec)] = 0
+    return wVec
+
   def nConns(self):
     """Returns number of active connections
     """
-    return int(np.sum(self.conn[4,:]))
+    return int(np.sum(self.connOn))
+
+  def hash(self):
+    """Returns canonical hash of the expressed network (see netHash)
+    """
+    if self.netHash is None:
+      self.netHash = netHash(self.wEdge, self.aVec, self.nInput, self.nOutput)
+    return self.netHash
+
+  def renumber(self, innovMap, nodeMap):
+    """Changes innovation numbers and node ids of genes, the expressed
+    network is not affected (see InnovRecord.merge)
+
+    Args:
+      innovMap - (dict) - old innovation number -> new one
+      nodeMap  - (dict) - old node id -> new one
+    """
+    connKey, node = self.connKey.copy(), self.node.copy()
+    for old, new in innovMap.items():
+      connKey[0,:][self.connKey[0,:] == old] = new
+    for old, new in nodeMap.items():
+      connKey[1:,:][self.connKey[1:,:] == old] = new
+      node[0,:][self.node[0,:] == old] = new
+    self.connKey, self.node = connKey, node
 
   def express(self):
     """Converts genes to weight matrix and activation vector
+    Nodes which cannot change the output are pruned from the expressed 
+    network, the genes (and nConn used for selection) are left untouched.
+    If only a single recorded change was made since the last expression, 
+    the previous order and matrix are updated instead of rebuilt.
     """
-    order, wMat = getNodeOrder(self.node, self.conn)
-    if order is not False:
-      self.wMat = wMat
-      self.aVec = self.node[2,order]
-
-      wVec = self.wMat.flatten()
-      wVec[np.isnan(wVec)] = 0
-      self.wVec  = wVec
-      self.nConn = np.sum(wVec!=0)
+    conn = self.conn
+    topo = None
+    if self.change is not None and self.topo is not None:
+      order, layers, edges = self.topo
+      topo = updateNodeOrder(self.node, conn, \
+                  (order, layers, getWeightMat(edges, len(order))), self.change)
+    self.change = None
+    self.netHash = None
+
+    if topo is None:
+      order, wMat = getNodeOrder(self.node, conn)
+      if order is not False:
+        topo = (order, getNodeLayers(wMat, self.nInput+1, self.nOutput), wMat)
+
+    if topo is not None:
+      order, layers, wMat = topo
+      edges = getEdgeList(wMat)
+      self.topo = (order.astype(np.int32), layers.astype(np.int32), edges)
+      self.nConn = int(np.sum(~np.isnan(edges[2,:])))
+
+      wMat, self.aVec = pruneNet(wMat, self.node[2,order],\
+                                 self.nInput, self.nOutput)
+      self.wEdge = edges if len(self.aVec) == len(order) else getEdgeList(wMat)
+      self.nodePruned = len(order) - len(self.aVec)
+      self.connPruned = self.nConn - int(np.sum(~np.isnan(self.wEdge[2,:])))
       return True
     else:
+      self.topo = None
       return False
 
 
@@ -103,58 +203,295 @@ def getNodeOrder(nodeG,connG):
     OR
 
     False, False      - if cycle is found
-
-  Todo:
-    * setdiff1d is slow, as all numbers are positive ints there is probably
-      a better way to do with indexing tricks and bitstrings.
   """
   conn = np.copy(connG)
   node = np.copy(nodeG)
   nIns = len(node[0,node[1,:] == 1]) + len(node[0,node[1,:] == 4])
   nOuts = len(node[0,node[1,:] == 2])
+  nNode = np.shape(node)[1]
   
-  # Create connection and initial weight matrices
+  # Map node ids to indices through a lookup table
   conn[3,conn[4,:]==0] = np.nan # disabled but still connected
-  src  = conn[1,:].astype(int)
-  dest = conn[2,:].astype(int)
-  
   lookup = node[0,:].astype(int)
-  for i in range(len(lookup)): # Can we vectorize this?
-    src[np.where(src==lookup[i])] = i
-    dest[np.where(dest==lookup[i])] = i
-  
-  wMat = np.zeros((np.shape(node)[1],np.shape(node)[1]))
-  wMat[src,dest] = conn[3,:]
-  connMat = wMat[nIns+nOuts:,nIns+nOuts:]
-  connMat[connMat!=0] = 1
-
-  # Topological Sort of Hidden Nodes
-  edge_in = np.sum(connMat,axis=0)
-  Q = np.where(edge_in==0)[0]  # Start with nodes with no incoming connections
-  for i in range(len(connMat)):
-    if (len(Q) == 0) or (i >= len(Q)):
-      Q = []
-      return False, False # Cycle found, can't sort
-    edge_out = connMat[Q[i],:]
-    edge_in  = edge_in - edge_out # Remove nodes' conns from total
-    nextNodes = np.setdiff1d(np.where(edge_in==0)[0], Q)
-    Q = np.hstack((Q,nextNodes))
-
-    if sum(edge_in) == 0:
-      break
+  nodeIdx = np.zeros(np.max(lookup)+1, dtype=int)
+  nodeIdx[lookup] = np.arange(nNode)
+  src  = nodeIdx[conn[1,:].astype(int)]
+  dest = nodeIdx[conn[2,:].astype(int)]
+
+  # Edges between hidden nodes, duplicates resolved as in matrix assignment
+  # (last one wins) and zero weights ignored
+  key = src*nNode + dest
+  _, last = np.unique(key[::-1], return_index=True)
+  last = len(key) - 1 - last
+  edge = last[(conn[3,last] != 0) & (src[last] >= nIns+nOuts) \
+                                  & (dest[last] >= nIns+nOuts)]
+  Q = topoSort(nNode-nIns-nOuts, src[edge]-nIns-nOuts, dest[edge]-nIns-nOuts)
+  if Q is False:
+    return False, False # Cycle found, can't sort
   
-  # Add In and outs back and reorder wMat according to sort
+  # Add In and outs back and fill wMat directly in sorted order
   Q += nIns+nOuts
   Q = np.r_[lookup[:nIns], Q, lookup[nIns:nIns+nOuts]]
-  wMat = wMat[np.ix_(Q,Q)]
+  rank = np.empty(nNode, dtype=int)
+  rank[Q] = np.arange(nNode)
+  wMat = np.zeros((nNode,nNode))
+  wMat[rank[src],rank[dest]] = conn[3,:]
+
+  # Connections between hidden nodes are stored as 1 (disabled ones as well)
+  hMat = wMat[nIns:nNode-nOuts,nIns:nNode-nOuts]
+  hMat[hMat!=0] = 1
   
   return Q, wMat
 
+def updateNodeOrder(nodeG, connG, topo, change):
+  """Updates order and weight matrix of genes after a single mutation
+  Kept order stays topological, but it is not necessarily the one a full
+  sort by getNodeOrder would produce.
+
+  Args:
+    nodeG  - (np_array) - node genes (after mutation)
+             [3 X nUniqueGenes]
+    connG  - (np_array) - connection genes (after mutation)
+             [5 X nUniqueGenes]
+    topo   - (tuple)    - (order, layers, wMat) before mutation (see Ind)
+    change - (tuple)    - mutation made:
+             ('act',)          - activation changed (or nothing did)
+             ('enable', iConn) - connection iConn enabled
+             ('conn',)         - connection added as last gene
+             ('node', iConn)   - connection iConn split by node added as last
+                                 gene, new connections are the last two genes
+
+  Returns:
+    topo   - (tuple)    - updated (order, layers, wMat)
+
+    OR
+
+    None                - if order has to change, genes must be sorted again
+  """
+  order, layers, wMat = topo
+  if change[0] == 'act':
+    return topo
+
+  nIns = np.sum(nodeG[1,:] == 1) + np.sum(nodeG[1,:] == 4)
+  nOuts = np.sum(nodeG[1,:] == 2)
+  nNode = len(order)
+
+  if change[0] == 'node':
+    # New node goes right before destination of the split connection
+    newNode = np.shape(nodeG)[1]-1
+    split = connG[:,change[1]]
+    dest = np.where(nodeG[0,:] == split[2])[0][0]
+    pos = np.where(order == dest)[0][0]
+    pos = min(pos, nNode-nOuts)
+    order = np.insert(order, pos, newNode)
+    wMat = np.insert(wMat, pos, 0, axis=0)
+    wMat = np.insert(wMat, pos, 0, axis=1)
+    nNode += 1
+    edits = [change[1], np.shape(connG)[1]-2, np.shape(connG)[1]-1]
+  elif change[0] == 'enable':
+    wMat = np.copy(wMat)
+    edits = [change[1]]
+  elif change[0] == 'conn':
+    wMat = np.copy(wMat)
+    edits = [np.shape(connG)[1]-1]
+  else:
+    return None
+
+  # Set connection weights, as getNodeOrder would
+  rank = np.zeros(np.max(nodeG[0,:]).astype(int)+1, dtype=int)
+  rank[nodeG[0,order].astype(int)] = np.arange(nNode)
+  newHidden = False
+  for iConn in edits:
+    src, dest = rank[int(connG[1,iConn])], rank[int(connG[2,iConn])]
+    same = (connG[1,:] == connG[1,iConn]) & (connG[2,:] == connG[2,iConn])
+    if src >= dest or connG[3,iConn] == 0 or np.sum(same) > 1:
+      return None # Order changes, or duplicate/zero genes
+    isHidden = (nIns <= src < nNode-nOuts) and (nIns <= dest < nNode-nOuts)
+    if isHidden:
+      newHidden |= wMat[src,dest] == 0
+      wMat[src,dest] = 1
+    elif connG[4,iConn] == 0:
+      wMat[src,dest] = np.nan
+    else:
+      wMat[src,dest] = connG[3,iConn]
+
+  if newHidden or change[0] == 'node':
+    layers = getNodeLayers(wMat, nIns, nOuts)
+  return order, layers, wMat
+
+def topoSort(nNode, src, dest):
+  """Kahn's sort in O(V+E) over an edge list
+  Starts from all nodes without incoming edges (ascending), then goes
+  through the queue in order, appending the nodes each one frees (ascending).
+
+  Args:
+    nNode - (int)      - number of nodes
+    src   - (np_array) - source of each (unique) edge
+            [nEdges X 1]
+    dest  - (np_array) - destination of each (unique) edge
+            [nEdges X 1]
+
+  Returns:
+    Q     - (np_array) - sorted node order
+            [nNode X 1]
+
+    OR
+
+    False             - if cycle is found
+  """
+  edgeIn = np.bincount(dest, minlength=nNode).tolist()
+  succ = [[] for _ in range(nNode)]
+  for s, d in zip(src.tolist(), dest.tolist()):
+    succ[s].append(d)
+
+  Q = [i for i in range(nNode) if edgeIn[i] == 0]
+  remaining = len(src)
+  i = 0
+  while remaining > 0:
+    if i >= len(Q):
+      return False
+    freed = []
+    for d in succ[Q[i]]:
+      edgeIn[d] -= 1
+      if edgeIn[d] == 0:
+        freed.append(d)
+    remaining -= len(succ[Q[i]])
+    Q.extend(sorted(freed))
+    i += 1
+  return np.array(Q, dtype=int)
+
+def pruneNet(wMat, aVec, nInput, nOutput):
+  """Removes hidden nodes which have no effect on the output
+  A hidden node is dead if it has no path to an output, or if nothing flows 
+  into it and its activation of 0 is 0 (linear, step, sin, tanh, inverse, 
+  abs, relu, squared). Removing one dead node can leave its neighbours dead,
+  so both are repeated until nothing changes.
+
+  Args:
+    wMat    - (np_array) - ordered weight matrix (NaN: disabled connection)
+              [N X N]
+    aVec    - (np_array) - activation function of each node (as int)
+              [N X 1]
+    nInput  - (int)      - number of inputs (without bias)
+    nOutput - (int)      - number of outputs
+
+  Returns:
+    wMat    - (np_array) - weight matrix of remaining nodes
+              [M X M]
+    aVec    - (np_array) - activation function of remaining nodes
+              [M X 1]
+  """
+  nNode = np.shape(wMat)[0]
+  live = (wMat != 0) & ~np.isnan(wMat)
+  zeroAct = np.isin(aVec, [1,2,3,5,7,8,9,11])
+  hidden = np.zeros(nNode, dtype=bool)
+  hidden[nInput+1:nNode-nOutput] = True
+
+  keep = np.ones(nNode, dtype=bool)
+  while True:
+    sub = live & keep[:,None] & keep[None,:]
+    noOut = hidden & ~np.any(sub, axis=1)
+    noIn  = hidden & zeroAct & ~np.any(sub, axis=0)
+    dead  = keep & (noOut | noIn)
+    if not np.any(dead):
+      break
+    keep &= ~dead
+
+  if np.all(keep):
+    return wMat, aVec
+  return wMat[np.ix_(keep,keep)], aVec[keep]
+
+def getEdgeList(wMat):
+  """Converts weight matrix to a list of its connections
+  Memory of an edge list grows with the number of connections, not with the
+  square of the number of nodes. Disabled connections are kept (as NaN), so
+  the matrix can be rebuilt exactly (see getWeightMat).
+
+  Args:
+    wMat  - (np_array) - ordered weight matrix
+           [N X N]
+
+  Returns:
+    edges - (np_array) - edge list
+           [3 X nConn]
+           [0,:] == Source node (index in wMat)
+           [1,:] == Destination node
+           [2,:] == Weight
+  """
+  src, dest = np.nonzero(wMat)
+  return np.vstack((src, dest, wMat[src,dest])).astype(np.float64)
+
+def getWeightMat(edges, nNode):
+  """Converts edge list back to weight matrix (see getEdgeList)
+
+  Args:
+    edges - (np_array) - edge list
+           [3 X nConn]
+    nNode - (int)      - number of nodes
+
+  Returns:
+    wMat  - (np_array) - weight matrix
+           [N X N]
+  """
+  wMat = np.zeros((nNode,nNode))
+  wMat[edges[0,:].astype(int),edges[1,:].astype(int)] = edges[2,:]
+  return wMat
+
+def isEdgeList(weights, nNode):
+  """Tells edge list [3 X nConn] apart from weight matrix [N X N] or [N**2]
+  """
+  return np.ndim(weights) == 2 and np.shape(weights) != (nNode, nNode)
+
+def netHash(wEdge, aVec, nInput, nOutput):
+  """Returns canonical hash of a network: equal for networks which compute 
+  the same function by the same structure, whatever the innovation ids and
+  order of their hidden nodes
+  Nodes are hashed in order. Inputs and outputs by their position and 
+  activation, hidden nodes by their activation and the sorted hashes and 
+  weights of their sources only -- two hidden nodes with equal hashes 
+  compute the same value. The network hash combines the output hashes, 
+  disabled connections and hidden nodes not feeding an output are ignored.
+
+  Args:
+    wEdge   - (np_array) - edge list of ordered network (see getEdgeList)
+              [3 X nConn]
+    aVec    - (np_array) - activation function of each node (as int)
+              [N X 1]
+    nInput  - (int)      - number of inputs (without bias)
+    nOutput - (int)      - number of outputs
+
+  Returns:
+    key     - (string)   - hex digest of network
+  """
+  nNode = len(aVec)
+  live = ~np.isnan(wEdge[2,:]) & (wEdge[2,:] != 0)
+  src  = wEdge[0,live].astype(int)
+  dest = wEdge[1,live].astype(int)
+  w    = wEdge[2,live]
+  byDest = np.argsort(dest, kind='stable')
+  start  = np.searchsorted(dest[byDest], np.arange(nNode+1))
+
+  digest = []
+  for i in range(nNode):
+    h = hashlib.blake2b(digest_size=16)
+    if i <= nInput:
+      h.update(b'i%d' % i)
+    elif i >= nNode-nOutput:
+      h.update(b'o%d' % (i-nNode+nOutput))
+    h.update(b'a%d' % int(aVec[i]))
+    for source in sorted([digest[src[k]] + w[k].tobytes() \
+                          for k in byDest[start[i]:start[i+1]]]):
+      h.update(source)
+    digest.append(h.digest())
+  return hashlib.blake2b(b''.join(digest[nNode-nOutput:]),\
+                         digest_size=16).hexdigest()
+
 def getLayer(wMat):
   """Get layer of each node in weight matrix
-  Traverse wMat by row, collecting layer of all nodes that connect to you (X).
-  Your layer is max(X)+1. Input and output nodes are ignored and assigned to 
-  layer 0 and max(X)+1 at the end.
+  Layer of a node is the longest path leading into it: nodes without 
+  incoming connections are in layer 0, every other node is one layer after
+  the deepest node connecting to it. As wMat is ordered all connections go
+  forward, so one pass over the connections sorted by destination is enough.
 
   Args:
     wMat  - (np_array) - ordered weight matrix
@@ -162,31 +499,43 @@ def getLayer(wMat):
 
   Returns:
     layer - [int]      - layer # of each node
-
-  Todo:
-    * With very large networks this might be a performance sink -- especially, 
-    given that this happen in the serial part of the algorithm. There is
-    probably a more clever way to do this given the adjacency matrix.
   """
-  wMat[np.isnan(wMat)] = 0  
-  wMat[wMat!=0]=1
   nNode = np.shape(wMat)[0]
-  layer = np.zeros((nNode))
-  while (True): # Loop until sorting is stable
-    prevOrder = np.copy(layer)
-    for curr in range(nNode):
-      srcLayer=np.zeros((nNode))
-      for src in range(nNode):
-        srcLayer[src] = layer[src]*wMat[src,curr]   
-      layer[curr] = np.max(srcLayer)+1    
-    if all(prevOrder==layer):
-      break
-  return layer-1
+  dest, src = np.nonzero(np.nan_to_num(wMat).T) # sorted by destination
+  layer = [0]*nNode
+  for s, d in zip(src.tolist(), dest.tolist()):
+    if layer[s] >= layer[d]:
+      layer[d] = layer[s]+1
+  return np.array(layer, dtype=float)
+
+def getNodeLayers(wMat, nIns, nOuts):
+  """Get layer of every node of an ordered network, as used by mutAddConn
+  Inputs (and bias) are in layer 0, hidden nodes follow from layer 1 (see 
+  getLayer) and outputs are all in the layer after the last hidden one.
+
+  Args:
+    wMat  - (np_array) - ordered weight matrix
+           [N X N]
+    nIns  - (int)      - number of inputs (with bias)
+    nOuts - (int)      - number of outputs
+
+  Returns:
+    layer - (np_array) - layer # of each node
+           [N X 1]
+  """
+  hMat = wMat[nIns:-nOuts,nIns:-nOuts]
+  hLay = getLayer(hMat)+1
+
+  if len(hLay) > 0:
+    lastLayer = np.max(hLay)+1
+  else:
+    lastLayer = 1
+  return np.r_[np.zeros(nIns), hLay, np.full((nOuts),lastLayer) ]
 
 
 # -- ANN Activation ------------------------------------------------------ -- #
 
-def act(weights, aVec, nInput, nOutput, inPattern):
+def act(weights, aVec, nInput, nOutput, inPattern, wVals=None, outMask=None):
   """Returns FFANN output given a single input pattern
   If the variable weights is a vector it is turned into a square weight matrix
   
@@ -195,9 +544,20 @@ def act(weights, aVec, nInput, nOutput, inPattern):
       Dim 0 : individual samples
       Dim 1 : dimensionality of pattern (# of inputs)
 
+  A network compiled with compileNet can be given in place of the weights,
+  it is then executed layer by layer (aVec, nInput and nOutput are taken from
+  the plan). Networks packed into a PopPlan are evaluated together (see 
+  actPop).
+
+  Given a vector of shared weight values the weights are treated as
+  connectivity scaled by each value, and all values are evaluated in a single
+  pass (see actPlan). Edge lists are always compiled first.
+
   Args:
     weights   - (np_array) - ordered weight matrix or vector
                 [N X N] or [N**2]
+                [3 X nConn] - or edge list (see getEdgeList)
+                (NetPlan)  - or compiled network
     aVec      - (np_array) - activation function of each node 
                 [N X 1]    - stored as ints (see applyAct in ann.py)
     nInput    - (int)      - number of input nodes
@@ -205,10 +565,24 @@ def act(weights, aVec, nInput, nOutput, inPattern):
     inPattern - (np_array) - input activation
                 [1 X nInput] or [nSamples X nInput]
 
+  Optional:
+    wVals     - (np_array) - shared weight values to evaluate at once
+                [nVals X 1]
+    outMask   - (np_array) - outputs which are needed, others may be skipped
+                [nOutput X 1] - bool (only used by NetPlan, see actPlan)
+
   Returns:
     output    - (np_array) - output activation
                 [1 X nOutput] or [nSamples X nOutput]
+                [nVals X nSamples X nOutput] if wVals are given
   """
+  if isinstance(weights, NetPlan):
+    return actPlan(weights, inPattern, wVals, outMask)
+  if isinstance(weights, PopPlan):
+    return actPop(weights, inPattern, wVals)
+  if wVals is not None or isEdgeList(weights, len(aVec)):
+    return actPlan(compileNet(weights, aVec, nInput, nOutput), inPattern, wVals)
+
   # Turn weight vector into weight matrix
   if np.ndim(weights) < 2:
       nNodes = int(np.sqrt(np.shape(weights)[0]))
@@ -302,6 +676,491 @@ def applyAct(actId, x):
 
   return value
 
+def getScaleDegree(weights, aVec, nInput, nOutput):
+  """Returns degree d of the outputs in the shared weight, so that for any
+  factor c > 0 the outputs with weight c*w are c**d times those with weight
+  w, or -1 if there is no such degree
+  Linear, inverse, absolute value and relu nodes are homogeneous of degree 
+  one in their input, squared nodes of degree two and step nodes of degree 
+  zero. Each connection adds one. Inputs and bias are constant (degree 0), 
+  nodes which are always 0 fit any degree. A node whose sources have
+  different degrees, or with any other activation, breaks homogeneity.
+
+  Args:
+    weights - (np_array) - ordered weight matrix
+              [N X N]
+              [3 X nConn] - or edge list (see getEdgeList)
+    aVec    - (np_array) - activation function of each node (as int)
+              [N X 1]
+    nInput  - (int)      - number of inputs (without bias)
+    nOutput - (int)      - number of outputs
+
+  Returns:
+    degree  - (int)      - degree of all outputs, -1 if not homogeneous
+  """
+  nNode = len(aVec)
+  if not isEdgeList(weights, nNode):
+    weights = getEdgeList(np.reshape(weights, (nNode,nNode)))
+  live = np.nan_to_num(weights[2,:]) != 0
+  src  = weights[0,live].astype(int)
+  dest = weights[1,live].astype(int)
+  byDest = np.argsort(dest, kind='stable')
+  start  = np.searchsorted(dest[byDest], np.arange(nNode+1))
+
+  anyDeg = None # always 0, fits any degree
+  degree = [0]*(nInput+1)
+  for i in range(nInput+1, nNode):
+    srcDeg = set([degree[src[k]] for k in byDest[start[i]:start[i+1]]])
+    srcDeg.discard(anyDeg)
+    actId = int(aVec[i])
+    if -1 in srcDeg or len(srcDeg) > 1:
+      degree.append(-1)
+    elif len(srcDeg) == 0: # constant
+      degree.append(anyDeg if actId in [1,2,3,5,7,8,9,11] else 0)
+    elif actId in [1,7,8,9]:
+      degree.append(srcDeg.pop()+1)
+    elif actId == 11:
+      degree.append(2*(srcDeg.pop()+1))
+    elif actId == 2:
+      degree.append(0)
+    else:
+      degree.append(-1)
+
+  outDeg = set(degree[nNode-nOutput:])
+  outDeg.discard(anyDeg)
+  if len(outDeg) > 1:
+    return -1
+  return outDeg.pop() if outDeg else 0
+
+
+# -- ANN Compilation ----------------------------------------------------- -- #
+
+class NetPlan():
+  """Execution plan of a network, compiled once and reused for every input
+  """
+  def __init__(self, nNode, nInput, nOutput, layers, powers=None):
+    """
+    Args:
+      nNode   - (int)   - number of nodes (bias, inputs, hidden, outputs)
+      nInput  - (int)   - number of inputs
+      nOutput - (int)   - number of outputs
+      layers  - [tuple] - nodes of each topological layer, in order:
+        nodes  - (np_array) - nodes of layer, sorted by activation
+                 [nLayerNodes X 1]
+        src    - (np_array) - nodes with connections into the layer
+                 [nLayerSrc X 1]
+        wMat   - (np_array) - weights of those connections only
+                 [nLayerSrc X nLayerNodes]
+        groups - [tuple]    - (activation, start, end) slices of 'nodes'
+
+    Optional:
+      powers  - [tuple] - connections of each layer as polynomials of the
+                          shared weight, sum of coef[k] * w**pows[k]:
+        pows   - (np_array) - powers of the shared weight
+                 [nPow X 1]
+        coefs  - (np_array) - coefficient of each power, summed into wMat
+                 [nPow X nLayerSrc X nLayerNodes]
+                (default: every connection is a single power of 1)
+
+    Attributes:
+      ancestors - (np_array) - nodes each output depends on (with itself)
+                  [nOutput X nNode]
+    """
+    if powers is None:
+      powers = [(np.array([1]), wMat[None,:,:]) for _,_,wMat,_ in layers]
+    self.nNode   = nNode
+    self.nInput  = nInput
+    self.nOutput = nOutput
+    self.layers  = layers
+    self.powers  = powers
+    self.scaled  = {} # Layer weights scaled by shared weight values
+
+    # Walk layers backwards, sources of needed nodes are needed as well
+    self.ancestors = np.zeros((nOutput, nNode), dtype=bool)
+    self.ancestors[:,nNode-nOutput:] = np.eye(nOutput, dtype=bool)
+    for (nodes, src, _, _), (_, coefs) in zip(reversed(layers), reversed(powers)):
+      feeds = np.dot(self.ancestors[:,nodes], np.any(coefs != 0, axis=0).T)
+      self.ancestors[:,src] |= feeds
+
+def compileNet(weights, aVec, nInput, nOutput, fold=True):
+  """Compiles ordered network into an execution plan
+  Nodes are grouped into topological layers, each layer gathers only its
+  real incoming connections and applies activations once per group of nodes
+  sharing an activation function.
+
+  Hidden linear and inverse nodes are folded into direct connections (see 
+  foldLinear), whose weights are then polynomials of the shared weight.
+
+  Args:
+    weights   - (np_array) - ordered weight matrix or vector
+                [N X N] or [N**2]
+                [3 X nConn] - or edge list (see getEdgeList)
+    aVec      - (np_array) - activation function of each node 
+                [N X 1]    - stored as ints (see applyAct in ann.py)
+    nInput    - (int)      - number of input nodes
+    nOutput   - (int)      - number of output nodes
+
+  Optional:
+    fold      - (bool)     - fold linear hidden nodes
+
+  Returns:
+    plan      - (NetPlan)  - compiled network
+  """
+  aVec = np.asarray(aVec).flatten()
+  nNode = len(aVec)
+  if isEdgeList(weights, nNode):
+    src  = weights[0,:].astype(int)
+    dest = weights[1,:].astype(int)
+    coef = np.nan_to_num(weights[2,:])
+    live = coef != 0
+    src, dest, coef = src[live], dest[live], coef[live]
+  else:
+    wMat = np.reshape(np.array(weights, dtype=np.float64), (nNode, nNode))
+    wMat[np.isnan(wMat)] = 0
+    src, dest = np.nonzero(wMat)
+    coef = wMat[src, dest]
+
+  # Only forward connections into non-input nodes are ever used by 'act'
+  keep = (dest > nInput) & (src < dest)
+  src, dest, coef = src[keep], dest[keep], coef[keep]
+  power = np.ones(len(src), dtype=int)
+  if fold:
+    src, dest, power, coef = foldLinear(src, dest, power, coef, aVec,\
+                                        nInput, nOutput)
+
+  # Layer of node is one more than deepest node connecting into it
+  layer = np.zeros(nNode, dtype=int)
+  layer[nInput+1:] = 1
+  while True:
+    newLayer = np.copy(layer)
+    np.maximum.at(newLayer, dest, layer[src]+1)
+    if np.array_equal(newLayer, layer):
+      break
+    layer = newLayer
+
+  # Hidden nodes feeding nothing (e.g. folded) are never read
+  used = np.zeros(nNode, dtype=bool)
+  used[src] = True
+  used[nNode-nOutput:] = True
+
+  layers, powers = [], []
+  for iLayer in range(1, np.max(layer, initial=0)+1):
+    nodes = np.where((layer == iLayer) & used)[0]
+    if len(nodes) == 0:
+      continue
+    nodes = nodes[np.argsort(aVec[nodes], kind='stable')]
+    into = np.isin(dest, nodes)
+    nodeSrc = np.unique(src[into])
+    pows = np.unique(power[into])
+
+    # Edges are unique per (src, dest, power), so assignment is enough
+    col = np.zeros(nNode, dtype=int)
+    col[nodes] = np.arange(len(nodes))
+    coefs = np.zeros((len(pows), len(nodeSrc), len(nodes)))
+    coefs[np.searchsorted(pows, power[into]), np.searchsorted(nodeSrc, src[into]),\
+          col[dest[into]]] = coef[into]
+    layerMat = np.sum(coefs, axis=0)
+
+    bounds = np.r_[0, np.where(np.diff(aVec[nodes]) != 0)[0]+1, len(nodes)]
+    groups = [(aVec[nodes[start]], start, end) \
+              for start, end in zip(bounds[:-1], bounds[1:])]
+    layers.append((nodes, nodeSrc, layerMat, groups))
+    powers.append((pows, coefs))
+
+  return NetPlan(nNode, nInput, nOutput, layers, powers)
+
+def foldLinear(src, dest, power, coef, aVec, nInput, nOutput):
+  """Replaces hidden linear and inverse nodes by direct connections
+  As every connection carries the same weight w, a path src -> node -> dest
+  through a linear node equals a connection src -> dest of weight 
+  sign * coef_in * coef_out * w**(pow_in + pow_out), with sign -1 for the 
+  inverse activation. Connections with the same source, destination and 
+  power are merged. A node is only folded if that does not increase the 
+  number of connections (fanIn * fanOut <= fanIn + fanOut).
+
+  Args:
+    src       - (np_array) - source node of each connection
+                [nConn X 1]
+    dest      - (np_array) - destination node of each connection
+                [nConn X 1]
+    power     - (np_array) - power of the shared weight of each connection
+                [nConn X 1]
+    coef      - (np_array) - coefficient of each connection
+                [nConn X 1]
+    aVec      - (np_array) - activation function of each node
+                [N X 1]
+    nInput    - (int)      - number of input nodes
+    nOutput   - (int)      - number of output nodes
+
+  Returns:
+    src, dest, power, coef - same, after folding
+  """
+  nNode = len(aVec)
+  sign = {1: 1.0, 7: -1.0}
+  linear = [i for i in range(nInput+1, nNode-nOutput) if aVec[i] in sign]
+  if not linear:
+    return src, dest, power, coef
+
+  # Adjacency of each node as {(node, power): coef}, in and out
+  edgeIn  = [{} for _ in range(nNode)]
+  edgeOut = [{} for _ in range(nNode)]
+  for s, d, p, c in zip(src, dest, power, coef):
+    edgeIn[d][(s,p)] = edgeIn[d].get((s,p), 0.0) + c
+    edgeOut[s][(d,p)] = edgeIn[d][(s,p)]
+
+  for node in linear: # Ascending, so sources are folded before their targets
+    fanIn, fanOut = len(edgeIn[node]), len(edgeOut[node])
+    if fanIn*fanOut > fanIn+fanOut:
+      continue
+    for s, pIn in edgeIn[node]:
+      del edgeOut[s][(node,pIn)]
+    for d, pOut in edgeOut[node]:
+      del edgeIn[d][(node,pOut)]
+    for (s, pIn), cIn in edgeIn[node].items():
+      for (d, pOut), cOut in edgeOut[node].items():
+        key = (s, pIn+pOut)
+        c = edgeIn[d].get(key, 0.0) + sign[aVec[node]]*cIn*cOut
+        if c == 0:
+          edgeIn[d].pop(key, None)
+          edgeOut[s].pop((d, pIn+pOut), None)
+        else:
+          edgeIn[d][key] = c
+          edgeOut[s][(d, pIn+pOut)] = c
+    edgeIn[node], edgeOut[node] = {}, {}
+
+  edges = [(s, d, p, c) for d in range(nNode) for (s, p), c in edgeIn[d].items()]
+  if not edges:
+    empty = np.zeros(0, dtype=int)
+    return empty, empty, empty, np.zeros(0)
+  src, dest, power, coef = zip(*edges)
+  return np.array(src), np.array(dest), np.array(power), np.array(coef)
+
+def scaleLayers(plan, wVals):
+  """Returns layer weights of plan multiplied by each shared weight value
+  Results are kept in the plan, so every set of values is scaled only once.
+  Folded connections are evaluated as polynomials of each value.
+
+  Args:
+    plan      - (NetPlan)  - compiled network
+    wVals     - (np_array) - shared weight values
+                [nVals X 1]
+
+  Returns:
+    layerMats - [np_array] - weights of each layer for every value
+                [nLayers X [nVals X nLayerSrc X nLayerNodes]]
+  """
+  key = tuple(wVals)
+  if key not in plan.scaled:
+    wVals = np.reshape(wVals, (-1,1,1,1))
+    plan.scaled[key] = [np.sum(coefs[None] * wVals**pows[None,:,None,None], \
+                               axis=1) for pows, coefs in plan.powers]
+  return plan.scaled[key]
+
+def actPlan(plan, inPattern, wVals=None, outMask=None):
+  """Returns output of compiled network given input patterns (see act)
+  With shared weight values the plan's weights are read as connectivity and
+  the network is evaluated for all values in one pass. Input patterns are
+  either shared by all values or given separately for each of them.
+
+  Given a mask of outputs only the subgraph feeding those outputs is 
+  evaluated, all other outputs are returned as 0.
+
+  Args:
+    plan      - (NetPlan)  - compiled network
+    inPattern - (np_array) - input activation
+                [1 X nInput] or [nSamples X nInput]
+                or [nVals X nSamples X nInput] if wVals are given
+
+  Optional:
+    wVals     - (np_array) - shared weight values to evaluate at once
+                [nVals X 1]
+    outMask   - (np_array) - outputs which are needed (e.g. legal moves)
+                [nOutput X 1] - bool
+
+  Returns:
+    output    - (np_array) - output activation
+                [1 X nOutput] or [nSamples X nOutput]
+                [nVals X nSamples X nOutput] if wVals are given
+  """
+  if np.ndim(inPattern) > 1:
+    nSamples = np.shape(inPattern)[-2]
+  else:
+    nSamples = 1
+
+  if wVals is None:
+    shape = (nSamples, plan.nNode)
+    layerMats = [wMat for _,_,wMat,_ in plan.layers]
+  else:
+    wVals = np.asarray(wVals, dtype=np.float64).flatten()
+    shape = (len(wVals), nSamples, plan.nNode)
+    layerMats = scaleLayers(plan, wVals)
+
+  nodeAct = np.zeros(shape)
+  nodeAct[...,0] = 1 # Bias activation
+  nodeAct[...,1:plan.nInput+1] = inPattern
+
+  if outMask is not None:
+    needed = np.any(plan.ancestors[np.asarray(outMask, dtype=bool)], axis=0)
+
+  for (nodes, src, _, groups), wMat in zip(plan.layers, layerMats):
+    if outMask is not None:
+      nodes, wMat, groups = maskLayer(nodes, wMat, groups, needed[nodes])
+    rawAct = np.matmul(nodeAct[...,src], wMat)
+    for actId, start, end in groups:
+      nodeAct[...,nodes[start:end]] = applyAct(actId, rawAct[...,start:end])
+  return nodeAct[...,-plan.nOutput:]
+
+def maskLayer(nodes, wMat, groups, keep):
+  """Returns part of a compiled layer computing only the kept nodes
+
+  Args:
+    nodes     - (np_array) - nodes of layer, sorted by activation
+                [nLayerNodes X 1]
+    wMat      - (np_array) - weights of connections into layer
+                [(nVals X) nLayerSrc X nLayerNodes]
+    groups    - [tuple]    - (activation, start, end) slices of 'nodes'
+    keep      - (np_array) - nodes to compute
+                [nLayerNodes X 1] - bool
+
+  Returns:
+    nodes, wMat, groups    - same, reduced to kept nodes (or left whole if
+                             most of them are kept)
+  """
+  sel = np.where(keep)[0]
+  if 2*len(sel) > len(nodes): # Slicing costs about as much as it saves
+    return nodes, wMat, groups
+  bounds = [np.searchsorted(sel, [start, end]) for _, start, end in groups]
+  groups = [(actId, newStart, newEnd) for (actId,_,_), (newStart, newEnd) \
+            in zip(groups, bounds) if newEnd > newStart]
+  return nodes[sel], wMat[...,sel], groups
+
+
+class PopPlan():
+  """Compiled networks of many individuals packed into one padded plan
+  Layer i of every individual is merged into a single layer of the packed
+  plan. Each individual keeps its own node space, padded to the size of the
+  largest network, with two extra nodes: one always zero (source of padded
+  connections) and one sink (destination of padded nodes).
+  """
+  def __init__(self, plans):
+    """
+    Args:
+      plans   - [NetPlan] - compiled network of each individual
+
+    Attributes:
+      nInd    - (int)      - number of individuals
+      nNode   - (int)      - nodes of each individual (with padding nodes)
+      nInput  - (int)      - number of inputs
+      nOutput - (int)      - number of outputs
+      outIdx  - (np_array) - output nodes of each individual
+                [nInd X nOutput]
+      layers  - [tuple]    - packed layers, in order:
+        src    - (np_array) - nodes connecting into the layer
+                 [nInd X maxLayerSrc]
+        nodes  - (np_array) - nodes of the layer
+                 [nInd X maxLayerNodes]
+        wMat   - (np_array) - weights, transposed (destination first)
+                 [nInd X maxLayerNodes X maxLayerSrc]
+        groups - [tuple]    - (activation, mask of nodes using it)
+        powers - (tuple)    - (pows, coefs) weights split by power of the
+                 shared weight, coefs [nPow X nInd X maxNodes X maxSrc]
+    """
+    nInd = len(plans)
+    nNode = max([plan.nNode for plan in plans])
+    zero, sink = nNode, nNode+1
+    self.nInd    = nInd
+    self.nNode   = nNode+2
+    self.nInput  = plans[0].nInput
+    self.nOutput = plans[0].nOutput
+    self.outIdx  = np.array([np.arange(plan.nNode-plan.nOutput, plan.nNode) \
+                             for plan in plans])
+
+    self.layers = []
+    for iLayer in range(max([len(plan.layers) for plan in plans])):
+      parts = [plan.layers[iLayer] for plan in plans if iLayer < len(plan.layers)]
+      maxSrc   = max([len(src)   for _, src, _, _   in parts])
+      maxNodes = max([len(nodes) for nodes, _, _, _ in parts])
+      pows = np.unique(np.hstack([plan.powers[iLayer][0] for plan in plans \
+                                  if iLayer < len(plan.layers)]))
+
+      src   = np.full((nInd, maxSrc), zero)
+      nodes = np.full((nInd, maxNodes), sink)
+      wMat  = np.zeros((nInd, maxNodes, maxSrc))
+      coefs = np.zeros((len(pows), nInd, maxNodes, maxSrc))
+      aMat  = np.zeros((nInd, maxNodes))
+      for iInd, plan in enumerate(plans):
+        if iLayer >= len(plan.layers):
+          continue
+        indNodes, indSrc, indMat, indGroups = plan.layers[iLayer]
+        indPows, indCoefs = plan.powers[iLayer]
+        src[iInd,:len(indSrc)] = indSrc
+        nodes[iInd,:len(indNodes)] = indNodes
+        wMat[iInd,:len(indNodes),:len(indSrc)] = indMat.T
+        coefs[np.searchsorted(pows, indPows),iInd,:len(indNodes),:len(indSrc)]\
+          = np.swapaxes(indCoefs, 1, 2)
+        for actId, start, end in indGroups:
+          aMat[iInd,start:end] = actId
+
+      groups = [(actId, aMat == actId) for actId in np.unique(aMat[nodes != sink])]
+      self.layers.append((src, nodes, wMat, groups, (pows, coefs)))
+
+def actPop(popPlan, inPattern, wVals=None):
+  """Returns output of every packed network, each given its own inputs
+  All individuals are evaluated together: one gather, one batched matrix 
+  product and one activation call per activation function for each layer.
+  With shared weight values outputs for all of them come from the same pass.
+
+  Args:
+    popPlan   - (PopPlan)  - packed networks
+    inPattern - (np_array) - input activation of each individual
+                [nInd X nSamples X nInput]
+                or [nInd X nVals X nSamples X nInput] if wVals are given
+
+  Optional:
+    wVals     - (np_array) - shared weight values to evaluate at once
+                [nVals X 1]
+
+  Returns:
+    output    - (np_array) - output activation of each individual
+                [nInd X nSamples X nOutput]
+                or [nInd X nVals X nSamples X nOutput] if wVals are given
+  """
+  nInd = popPlan.nInd
+  shape = np.shape(inPattern)[1:-1]
+  inPattern = np.reshape(inPattern, (nInd, -1, popPlan.nInput))
+  nCol = np.shape(inPattern)[1]
+
+  # Node activations stored node first: [nInd X nNode X (nVals*nSamples)]
+  nodeAct = np.zeros((nInd, popPlan.nNode, nCol))
+  nodeAct[:,0,:] = 1 # Bias activation
+  nodeAct[:,1:popPlan.nInput+1,:] = np.swapaxes(inPattern, 1, 2)
+  if wVals is not None:
+    wVals = np.asarray(wVals, dtype=np.float64).flatten()
+    wCol = np.repeat(wVals, nCol//len(wVals))
+
+  iInd = np.arange(nInd)[:,None]
+  for src, nodes, wMat, groups, (pows, coefs) in popPlan.layers:
+    srcAct = nodeAct[iInd,src]
+    if wVals is None:
+      rawAct = np.matmul(wMat, srcAct)
+    elif len(pows) == 1:
+      rawAct = np.matmul(wMat, srcAct) * wCol**pows[0]
+    else:
+      # Same summation order as scaleLayers: polynomial first, then product
+      wPoly = np.sum(coefs[:,:,None] * wVals[None,None,:,None,None]**\
+                     pows[:,None,None,None,None], axis=0)
+      srcAct = np.reshape(srcAct, (nInd, -1, len(wVals), nCol//len(wVals)))
+      rawAct = np.matmul(np.transpose(srcAct, (0,2,3,1)), \
+                         np.swapaxes(wPoly, 2, 3))
+      rawAct = np.reshape(np.transpose(rawAct, (0,3,1,2)), (nInd, -1, nCol))
+    for actId, mask in groups:
+      rawAct[mask] = applyAct(actId, rawAct[mask])
+    nodeAct[iInd,nodes] = rawAct
+
+  output = np.swapaxes(nodeAct[iInd,popPlan.outIdx], 1, 2)
+  return np.reshape(output, (nInd,) + shape + (popPlan.nOutput,))
+
+
 # -- Action Selection ---------------------------------------------------- -- #
 def selectAct(action, actSelect):  
   """Selects action based on vector of actions
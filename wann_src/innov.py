@@ -0,0 +1,135 @@
+import numpy as np
+
+
+class InnovRecord():
+  """Record of structural innovations: new connections and new nodes
+  Innovations are indexed by (source, destination, kind), so a connection
+  added, or split by a new node, more than once in the same generation gets
+  the same innovation numbers (and node id) every time -- unless the genome
+  already holds that node, then new ones are given. Innovation numbers and 
+  node ids are running counters.
+  """
+  def __init__(self, nextInnov=0, nextNode=0):
+    """
+    Args:
+      nextInnov - (int) - next free innovation number
+      nextNode  - (int) - next free node id
+
+    Attributes:
+      rows      - [list] - [innovation, source, destination, new node id
+                           (-1 if none), generation] of each innovation
+      index     - (dict) - (source, destination, kind) -> (generation,
+                           innovation numbers, node id) of last innovation
+    """
+    self.nextInnov = nextInnov
+    self.nextNode  = nextNode
+    self.rows  = []
+    self.index = {}
+
+  def __len__(self):
+    return len(self.rows)
+
+  def addConn(self, src, dest, gen):
+    """Returns innovation number of a new connection
+
+    Args:
+      src   - (int) - source node id
+      dest  - (int) - destination node id
+      gen   - (int) - current generation
+
+    Returns:
+      innov - (int) - innovation number
+    """
+    key = (int(src), int(dest), 'conn')
+    if key in self.index and self.index[key][0] == gen:
+      return self.index[key][1][0]
+
+    innov = self.nextInnov
+    self.nextInnov += 1
+    self.rows.append([innov, key[0], key[1], -1, gen])
+    self.index[key] = (gen, (innov,), -1)
+    return innov
+
+  def addNode(self, src, dest, gen, nodes=()):
+    """Returns innovation numbers and node id of a node splitting connection
+
+    Args:
+      src   - (int) - source node id of split connection
+      dest  - (int) - destination node id of split connection
+      gen   - (int) - current generation
+
+    Optional:
+      nodes - (np_array) - node ids already in genome
+
+    Returns:
+      innovTo   - (int) - innovation number of connection to new node
+      innovFrom - (int) - innovation number of connection from new node
+      node      - (int) - id of new node
+    """
+    key = (int(src), int(dest), 'node')
+    known = key in self.index and self.index[key][0] == gen
+    if known and self.index[key][2] not in nodes:
+      innovTo, innovFrom = self.index[key][1]
+      return innovTo, innovFrom, self.index[key][2]
+
+    innovTo, innovFrom, node = self.nextInnov, self.nextInnov+1, self.nextNode
+    self.nextInnov += 2
+    self.nextNode  += 1
+    self.rows.append([innovTo, key[0], node, node, gen])
+    self.rows.append([innovFrom, node, key[1], -1, gen])
+    if not known: # (first ids stay recorded for other genomes)
+      self.index[key] = (gen, (innovTo, innovFrom), node)
+    return innovTo, innovFrom, node
+
+  def reserve(self, nInnov, nNode):
+    """Returns empty record drawing from a block of innovation numbers and
+    node ids reserved for it, innovations made elsewhere (e.g. by a worker)
+    are added back with merge
+    """
+    block = InnovRecord(self.nextInnov, self.nextNode)
+    self.nextInnov += nInnov
+    self.nextNode  += nNode
+    return block
+
+  def merge(self, record, nodes=()):
+    """Adds innovations of a record created by reserve. Innovations already
+    made in the same generation keep the ids recorded first, the genes of 
+    the individual holding record are to be renumbered to them (see 
+    Wann.setPop).
+
+    Args:
+      record    - (InnovRecord) - innovations of a single individual
+
+    Optional:
+      nodes     - (np_array)    - node ids in genome of the individual, a 
+                                  recorded node among them is not reused
+
+    Returns:
+      innovMap  - (dict) - innovation number in record -> recorded one
+      nodeMap   - (dict) - node id in record -> recorded one
+    """
+    innovMap, nodeMap = {}, {}
+    for key, (gen, innovs, node) in record.index.items():
+      known = key in self.index and self.index[key][0] == gen
+      if known and self.index[key][2] not in nodes:
+        innovMap.update(zip(innovs, self.index[key][1]))
+        if node != -1:
+          nodeMap[node] = self.index[key][2]
+      elif not known:
+        self.index[key] = (gen, innovs, node)
+    self.rows += [row for row in record.rows if row[0] not in innovMap]
+    return innovMap, nodeMap
+
+  def asArray(self):
+    """Returns record in array layout
+
+    Returns:
+      innov - (np_array) - innovation record
+              [5 X nUniqueGenes]
+              [0,:] == Innovation Number
+              [1,:] == Source
+              [2,:] == Destination
+              [3,:] == New Node?
+              [4,:] == Generation evolved
+    """
+    return np.reshape(np.array(self.rows, dtype=np.float64), (-1,5)).T
@@ -16,120 +16,105 @@ def nsga_sort(objVals, returnFronts=False):
             int([nIndividuals X 1])
     front   - (np_array) - Pareto front of each individual
             int([nIndividuals X 1]) 
-  
-  Todo: 
-    * Extend to N objectives
   """
   # Sort by dominance into fronts
   fronts = getFronts(objVals)
+  order = np.concatenate(fronts)
+  frontId = np.repeat(np.arange(len(fronts)), [len(f) for f in fronts])
+
+  # Rank each front by crowding distance -- ties keep their order in front
+  crowdDist = getCrowdingDist(objVals[order], frontId)
+  order = order[np.lexsort((np.arange(len(order)), -crowdDist, frontId))]
 
-  # Rank each front by crowding distance
-  for f in range(len(fronts)):
-    x1 = objVals[fronts[f],0]
-    x2 = objVals[fronts[f],1]    
-    crowdDist = getCrowdingDist(x1) + getCrowdingDist(x2)
-    frontRank = np.argsort(-crowdDist)
-    fronts[f] = [fronts[f][i] for i in frontRank]
-    
   # Convert to ranking
-  tmp = [ind for front in fronts for ind in front]  
-  rank = np.empty_like(tmp)
-  rank[tmp] = np.arange(len(tmp))
+  rank = np.empty_like(order)
+  rank[order] = np.arange(len(order))
 
   if returnFronts is True:
-    return rank, fronts
+    bounds = np.cumsum([len(f) for f in fronts])[:-1]
+    return rank, [list(front) for front in np.split(order, bounds)]
   else:
     return rank
 
 def getFronts(objVals):
   """Fast non-dominated sort.
+  Dominance of all pairs is found at once as a boolean matrix, fronts are
+  then peeled off one at a time. Individuals of a front are ordered by the
+  last individual of the previous front dominating them, then by index, as
+  in the classic algorithm which decrements domination counts front by front.
   
   Args: 
     objVals - (np_array) - Objective values of each individual
               [nInds X nObjectives]
       
   Returns: 
-    front   - [list of lists] - One list for each front: 
-                                list of indices of individuals in front
-    
-  Todo: 
-    * Extend to N objectives
-
-  [adapted from: https://github.com/haris989/NSGA-II]
+    front   - [np_array] - One array for each front:
+                           indices of individuals in front
   """
-    
-  values1 = objVals[:,0]
-  values2 = objVals[:,1]
-  
-  S=[[] for i in range(0,len(values1))]
-  front = [[]]
-  n=[0 for i in range(0,len(values1))]
-  rank = [0 for i in range(0, len(values1))]
+  nInd = np.shape(objVals)[0]
 
-  # Get dominance relations
-  for p in range(0,len(values1)):
-      S[p]=[]
-      n[p]=0
-      for q in range(0, len(values1)):
-          if (values1[p] >  values1[q] and values2[p] >  values2[q]) \
-          or (values1[p] >= values1[q] and values2[p] >  values2[q]) \
-          or (values1[p] >  values1[q] and values2[p] >= values2[q]):
-              if q not in S[p]:
-                  S[p].append(q)
-          elif (values1[q] >  values1[p] and values2[q] >  values2[p]) \
-          or (  values1[q] >= values1[p] and values2[q] >  values2[p]) \
-          or (  values1[q] >  values1[p] and values2[q] >= values2[p]):
-              n[p] = n[p] + 1
-      if n[p]==0:
-          rank[p] = 0
-          if p not in front[0]:
-              front[0].append(p)
+  # Get dominance relations -- dom[p,q]: p dominates q
+  geq = np.ones((nInd,nInd), dtype=bool)
+  gtr = np.zeros((nInd,nInd), dtype=bool)
+  for values in np.transpose(objVals):
+    geq &= values[:,None] >= values[None,:]
+    gtr |= values[:,None] >  values[None,:]
+  dom = geq & gtr
+  nDom = np.sum(dom, axis=0)
 
   # Assign fronts
-  i = 0
-  while(front[i] != []):
-      Q=[]
-      for p in front[i]:
-          for q in S[p]:
-              n[q] =n[q] - 1
-              if( n[q]==0):
-                  rank[q]=i+1
-                  if q not in Q:
-                      Q.append(q)
-      i = i+1
-      front.append(Q)
-  del front[len(front)-1]
-  return front
+  fronts = []
+  front = np.flatnonzero(nDom == 0)
+  while len(front) > 0:
+    fronts.append(front)
+    nDom[front] = -1
+    nDom -= np.sum(dom[front], axis=0)
+    nextFront = np.flatnonzero(nDom == 0)
+    lastDom = len(front) - 1 - np.argmax(dom[front[::-1]][:,nextFront], axis=0)
+    front = nextFront[np.lexsort((nextFront, lastDom))]
+  return fronts
 
-def getCrowdingDist(objVector):
-  """Returns crowding distance of a vector of values, used once on each front.
+def getCrowdingDist(objVals, frontId):
+  """Returns crowding distance of each individual within its front, all
+  fronts are computed together.
 
   Note: Crowding distance of individuals at each end of front is infinite, as 
   they don't have a neighbor.
 
   Args: 
-    objVector - (np_array) - Objective values of each individual
-                [nInds X nObjectives]      
+    objVals   - (np_array) - Objective values of each individual
+                [nInds X nObjectives]
+    frontId   - (np_array) - Front of each individual, ties in objective
+                [nInds X 1]  value are sorted by position in objVals
       
   Returns: 
-    dist      - (np_array) - Crowding distance of each individual
-                [nIndividuals X 1]
+    dist      - (np_array) - Crowding distance of each individual, summed
+                [nIndividuals X 1] over all objectives
   """
-  # Order by objective value
-  key = np.argsort(objVector)
-  sortedObj = objVector[key]
-    
-  # Distance from values on either side
-  shiftVec = np.r_[np.inf,sortedObj,np.inf] # Edges have infinite distance
-  warnings.filterwarnings("ignore", category=RuntimeWarning) # inf on purpose
-  prevDist = np.abs(sortedObj-shiftVec[:-2])
-  nextDist = np.abs(sortedObj-shiftVec[2:])
-  crowd = prevDist+nextDist
-  if (sortedObj[-1]-sortedObj[0]) > 0:
-    crowd *= abs((1/sortedObj[-1]-sortedObj[0])) # Normalize by fitness range
-  
-  # Restore original order
-  dist = np.empty(len(key))
-  dist[key] = crowd[:]
+  nInd = np.shape(objVals)[0]
+  dist = np.zeros(nInd)
+  for values in np.transpose(objVals):
+    # Order by front, then by objective value
+    key = np.lexsort((np.arange(nInd), values, frontId))
+    sortedObj = values[key]
+    sortedFront = frontId[key]
+    first = np.r_[True, sortedFront[1:] != sortedFront[:-1]]
+    last  = np.r_[sortedFront[1:] != sortedFront[:-1], True]
+
+    # Distance from values on either side
+    with np.errstate(invalid='ignore', divide='ignore'): # inf on purpose
+      prevDist = np.where(first, np.inf, np.abs(sortedObj-np.r_[0,sortedObj[:-1]]))
+      nextDist = np.where(last,  np.inf, np.abs(sortedObj-np.r_[sortedObj[1:],0]))
+      crowd = prevDist+nextDist
+
+      # Normalize by fitness range of front
+      seg = np.cumsum(first)-1
+      lo = sortedObj[first][seg]
+      hi = sortedObj[last][seg]
+      norm = (hi-lo) > 0
+      crowd[norm] *= abs((1/hi[norm]-lo[norm]))
+
+    # Restore original order
+    dist[key] += crowd
 
-  return dist
\ No newline at end of file
+  return dist
@@ -2,8 +2,9 @@ import numpy as np
 import time
 import sys
 import random
+import hashlib
 
-from domain.make_env import make_env
+from domain.make_env import make_env, make_vec_env
 from .ind import *
 
 
@@ -31,6 +32,11 @@ class Task():
     # Environment
     self.maxEpisodeLength = game.max_episode_length
     self.actSelect = game.actionSelect
+    self.envName = game.env_name
+    self.vecEnv = None # Created on first lockstep evaluation
+    self.memo = None   # Outputs of the evaluated individual (see actMemo)
+    self.memoSize  = 0
+    self.memoCount = [0, 0] # Lookups and hits of all memos
 
     if not paramOnly:
       self.env = make_env(game.env_name)
@@ -39,17 +45,20 @@ class Task():
     self.needsClosed = (game.env_name.startswith("CartPoleSwingUp"))    
   
 
-  def testInd(self, wVec, aVec, view=False,seed=-1):
+  def testInd(self, wVec, aVec, view=False,seed=-1,wVal=None,maskOutputs=False):
     """Evaluate individual on task
     Args:
       wVec    - (np_array) - weight matrix as a flattened vector
                 [N**2 X 1]
+                (NetPlan)  - or network compiled with compileNet
       aVec    - (np_array) - activation function of each node 
                 [N X 1]    - stored as ints (see applyAct in ann.py)
   
     Optional:
       view    - (bool)     - view trial?
       seed    - (int)      - starting random seed for trials
+      wVal    - (float)    - shared weight value, wVec is then connectivity
+      maskOutputs - (bool) - only compute outputs of legal moves (Reversi)
   
     Returns:
       fitness - (float)    - reward earned in trial
@@ -62,8 +71,8 @@ class Task():
     state = self.env.reset()
     self.env.t = 0
 
-    annOut = act(wVec, aVec, self.nInput, self.nOutput, state)  
-    action = selectAct(annOut,self.actSelect)    
+    annOut = self.actMemo(wVec, aVec, state, wVal, maskOutputs)
+    action = selectAct(np.reshape(annOut,(-1,self.nOutput)),self.actSelect)
     
     state, reward, done, info = self.env.step(action)
     if self.maxEpisodeLength == 0:
@@ -72,8 +81,8 @@ class Task():
       totalReward = reward
     
     for tStep in range(self.maxEpisodeLength): 
-      annOut = act(wVec, aVec, self.nInput, self.nOutput, state) 
-      action = selectAct(annOut,self.actSelect) 
+      annOut = self.actMemo(wVec, aVec, state, wVal, maskOutputs)
+      action = selectAct(np.reshape(annOut,(-1,self.nOutput)),self.actSelect)
       state, reward, done, info = self.env.step(action)
       totalReward += reward  
       if view:
@@ -87,6 +96,105 @@ class Task():
 
     return totalReward
 
+  def actMemo(self, wVec, aVec, state, wVal=None, maskOutputs=False):
+    """Returns network output in the current state of the environment
+    While a memo is kept (see getDistFitness) outputs are looked up by board
+    number and weight value, the network is only run on positions it has 
+    not seen yet. Up to memoSize outputs are stored.
+
+    Args:
+      wVec    - (np_array) - weights or compiled network (see testInd)
+      aVec    - (np_array) - activation function of each node 
+                [N X 1]
+      state   - (np_array) - observation
+                [1 X nInput]
+
+    Optional:
+      wVal    - (float)    - shared weight value
+      maskOutputs - (bool) - only compute outputs of legal moves (Reversi)
+
+    Returns:
+      annOut  - (np_array) - network output
+                [1 X nOutput]
+    """
+    key = None
+    if self.memo is not None:
+      key = (self.env.get_number(), wVal)
+      self.memoCount[0] += 1
+      if key in self.memo:
+        self.memoCount[1] += 1
+        return self.memo[key]
+
+    wVals = None if wVal is None else np.array([wVal])
+    outMask = self.env.get_legal_moves() if maskOutputs else None
+    annOut = act(wVec, aVec, self.nInput, self.nOutput, state, wVals, outMask)
+    if key is not None and len(self.memo) < self.memoSize:
+      self.memo[key] = annOut
+    return annOut
+
+  def testIndLockstep(self, wVec, aVec, wVals, nRep, seed=-1, maskOutputs=False):
+    """Evaluate individual on all trials at once, one batch per timestep
+    Plays nRep games with every weight value in a vectorized environment,
+    all values are evaluated by a single network call per timestep.
+    Game iRep*nVals+iVal is seeded like testInd with seed+iRep, so with the
+    same seeds it is identical to the serial evaluation.
+
+    Given individuals packed into a PopPlan, games of all of them are played
+    together and evaluated by a single call to the packed networks.
+
+    Args:
+      wVec    - (np_array) - connection matrix as a flattened vector
+                [N**2 X 1]
+                (NetPlan)  - or connectivity compiled with compileNet
+                (PopPlan)  - or connectivity of many individuals
+      aVec    - (np_array) - activation function of each node 
+                [N X 1]    - stored as ints (see applyAct in ann.py)
+      wVals   - (np_array) - shared weight values to test
+                [nVals X 1]
+      nRep    - (int)      - number of games played with each weight value
+
+    Optional:
+      seed    - (int)      - starting random seed for trials
+                [nInd X 1] - or one for each packed individual
+      maskOutputs - (bool) - only compute outputs of moves legal in any game
+
+    Returns:
+      reward  - (np_array) - reward earned in each trial
+                [nRep X nVals] or [nInd X nRep X nVals]
+    """
+    nInd = wVec.nInd if isinstance(wVec, PopPlan) else 1
+    nVals = len(wVals)
+    nGames = nInd*nRep*nVals
+    if self.vecEnv is None or self.vecEnv.n_envs != nGames:
+      self.vecEnv = make_vec_env(self.envName, nGames, autoreset=False)
+
+    seed = np.broadcast_to(seed, (nInd,))
+    if np.all(seed >= 0):
+      seeds = seed[:,None] + np.arange(nRep)
+      self.vecEnv.seed(np.repeat(seeds.flatten(), nVals).tolist())
+    else:
+      self.vecEnv.seed()
+
+    state = self.vecEnv.reset()
+    totalReward = np.zeros(nGames)
+    for tStep in range(self.maxEpisodeLength+1):
+      # -- games are stored rep by rep, network takes them value by value
+      state = np.swapaxes(np.reshape(state, (nInd, nRep, nVals, -1)), 1, 2)
+      if nInd == 1:
+        state = state[0]
+      outMask = np.any(self.vecEnv.get_legal_moves(),axis=0) if maskOutputs else None
+      annOut = act(wVec, aVec, self.nInput, self.nOutput, state, wVals, outMask)
+      annOut = np.swapaxes(np.reshape(annOut, (nInd, nVals, nRep, -1)), 1, 2)
+      action = selectAct(np.reshape(annOut, (nGames, -1)),self.actSelect)
+      state, reward, done, info = self.vecEnv.step(action)
+      totalReward += reward
+      if np.all(done):
+        break
+
+    if nInd == 1:
+      return np.reshape(totalReward, (nRep, nVals))
+    return np.reshape(totalReward, (nInd, nRep, nVals))
+
 # -- 'Weight Agnostic Network' evaluation -------------------------------- -- #
   def setWeights(self, wVec, wVal):
     """Set single shared weight of network
@@ -94,12 +202,20 @@ class Task():
     Args:
       wVec    - (np_array) - weight matrix as a flattened vector
                 [N**2 X 1]
+                [3 X nConn] - or edge list (see getEdgeList in ind.py)
       wVal    - (float)    - value to assign to all weights
   
     Returns:
       wMat    - (np_array) - weight matrix with single shared weight
                 [N X N]
+                [3 X nConn] - or edge list if given one
     """
+    if np.ndim(wVec) == 2: # Edge list, only real connections are kept
+      wEdge = np.array(wVec, dtype=np.float64)
+      wEdge = wEdge[:,np.nan_to_num(wEdge[2,:]) != 0]
+      wEdge[2,:] = wVal
+      return wEdge
+
     # Create connection matrix
     wVec[np.isnan(wVec)] = 0
     dim = int(np.sqrt(np.shape(wVec)[0]))    
@@ -118,11 +234,17 @@ class Task():
     Args:
       wVec    - (np_array) - weight matrix as a flattened vector
                 [N**2 X 1]
+                [3 X nConn] - or edge list (see getEdgeList in ind.py)
       aVec    - (np_array) - activation function of each node 
                 [N X 1]    - stored as ints (see applyAct in ann.py)
       hyp     - (dict)     - hyperparameters
         ['alg_wDist']        - weight distribution  [standard;fixed;linspace]
         ['alg_absWCap']      - absolute value of highest weight for linspace
+        ['alg_lockstep']     - play all trials at once in a vectorized env
+        ['alg_maskOutputs']  - only compute outputs of legal moves
+        ['alg_equivVals']    - play weight values giving the same moves once
+        ['alg_memoSize']     - outputs memoized by board number while the
+                               individual is played (serial Reversi only)
   
     Optional:
       seed    - (int)      - starting random seed for trials
@@ -137,23 +259,212 @@ class Task():
       nRep = hyp['alg_nReps']
 
     # Set weight values to test WANN with
-    if (hyp['alg_wDist'] == "standard") and nVals==6: # Double, constant, and half signal 
-      wVals = np.array((-2,-1.0,-0.5,0.5,1.0,2))
-    else:
-      wVals = np.linspace(-self.absWCap, self.absWCap ,nVals)
+    wVals = self.getWeightVals(hyp, nVals)
 
+    # Values giving the same moves are only played once
+    play, share = np.arange(nVals), np.arange(nVals)
+    if hyp['alg_equivVals'] and not view:
+      play, share = self.getEquivVals(wVec, aVec, wVals)
 
     # Get reward from 'reps' rollouts -- test population on same seeds
-    reward = np.empty((nRep,nVals))
-    for iRep in range(nRep):
-      for iVal in range(nVals):
-        wMat = self.setWeights(wVec,wVals[iVal])
-        if seed == -1:
-          reward[iRep,iVal] = self.testInd(wMat, aVec, seed=seed,view=view)
-        else:
-          reward[iRep,iVal] = self.testInd(wMat, aVec, seed=seed+iRep,view=view)
+    # -- connectivity is compiled once, weight values are applied by 'act'
+    plan = compileNet(self.setWeights(wVec,1.0), aVec, self.nInput,\
+                      self.nOutput)
+    mask = hyp['alg_maskOutputs']
+    if hyp['alg_memoSize'] > 0 and hasattr(self.env, 'get_number'):
+      self.memo, self.memoSize = {}, hyp['alg_memoSize']
+    try:
+      if hyp['alg_lockstep'] and not view:
+        reward = self.testIndLockstep(plan, aVec, wVals[play], nRep, seed=seed,\
+                                      maskOutputs=mask)
+      else:
+        reward = np.empty((nRep,len(play)))
+        for iRep in range(nRep):
+          for iVal, wVal in enumerate(wVals[play]):
+            if seed == -1:
+              reward[iRep,iVal] = self.testInd(plan, aVec, seed=seed,view=view,\
+                                               wVal=wVal,maskOutputs=mask)
+            else:
+              reward[iRep,iVal] = self.testInd(plan, aVec, seed=seed+iRep,view=view,\
+                                               wVal=wVal,maskOutputs=mask)
+    finally: # a stale memo would answer for the next network
+      self.memo = None
+    reward = reward[:,share]
           
     if returnVals is True:
       return np.mean(reward,axis=0), wVals
     return np.mean(reward,axis=0)
  
+
+  def getPopFitness(self, wVecs, aVecs, hyp, seed=-1, nRep=False, nVals=6):
+    """Get fitness of many individuals with distribution of weights
+    In lockstep mode networks of all individuals are packed into a single 
+    PopPlan and all their games are played together, otherwise each is 
+    evaluated by getDistFitness.
+    With hyp['alg_equivVals'] individuals are packed by the weight values 
+    they have to play (see getEquivVals).
+
+    Args:
+      wVecs   - [np_array] - weight matrix of each individual as a vector
+                [nInd X [N**2 X 1]] - or as an edge list [3 X nConn]
+      aVecs   - [np_array] - activation function of nodes of each individual
+                [nInd X [N X 1]]
+      hyp     - (dict)     - hyperparameters (see getDistFitness)
+
+    Optional:
+      seed    - (int)      - starting random seed for trials
+                [nInd X 1] - or one for each individual
+      nReps   - (int)      - number of trials to get average fitness
+      nVals   - (int)      - number of weight values to test
+
+    Returns:
+      fitness - (np_array) - mean reward of each individual for each value
+                [nInd X nVals]
+    """
+    if nRep is False:
+      nRep = hyp['alg_nReps']
+    seed = np.broadcast_to(seed, (len(wVecs),))
+
+    if not hyp['alg_lockstep']:
+      return np.array([self.getDistFitness(wVec, aVec, hyp, seed=int(iSeed), \
+                                           nRep=nRep, nVals=nVals) \
+                       for wVec, aVec, iSeed in zip(wVecs, aVecs, seed)])
+
+    wVals = self.getWeightVals(hyp, nVals)
+    plans = [compileNet(self.setWeights(wVec,1.0), aVec, self.nInput,\
+                        self.nOutput) for wVec, aVec in zip(wVecs, aVecs)]
+    if not hyp['alg_equivVals']:
+      reward = self.testIndLockstep(PopPlan(plans), None, wVals, nRep, seed=seed)
+      return np.mean(reward,axis=1)
+
+    # Individuals playing the same subset of values are packed together
+    equiv = [self.getEquivVals(wVec, aVec, wVals) \
+             for wVec, aVec in zip(wVecs, aVecs)]
+    fitness = np.empty((len(plans), nVals))
+    for play in set([tuple(play) for play, share in equiv]):
+      inds = [i for i in range(len(plans)) if tuple(equiv[i][0]) == play]
+      reward = self.testIndLockstep(PopPlan([plans[i] for i in inds]), None,\
+                                    wVals[list(play)], nRep, seed=seed[inds])
+      for i, iInd in enumerate(inds):
+        fitness[iInd,:] = np.mean(reward[i],axis=0)[equiv[iInd][1]]
+    return fitness
+
+  def getEquivVals(self, wVec, aVec, wVals):
+    """Finds weight values which give the same games
+    The agent plays the legal move with the highest output (Reversi). If all
+    outputs are homogeneous in the shared weight (see getScaleDegree), values
+    of the same sign only scale them by a common positive factor, so only the
+    first value of each sign is played. Exact for ratios which are powers of 
+    two (as in the standard distribution), otherwise near ties may differ.
+
+    Args:
+      wVec    - (np_array) - weight matrix as a flattened vector
+                [N**2 X 1]
+                [3 X nConn] - or edge list (see getEdgeList in ind.py)
+      aVec    - (np_array) - activation function of each node 
+                [N X 1]    - stored as ints (see applyAct in ann.py)
+      wVals   - (np_array) - weight values
+                [nVals X 1]
+
+    Returns:
+      play    - (np_array) - index of values which have to be played
+                [nPlay X 1]
+      share   - (np_array) - index in play of the games of each value
+                [nVals X 1]
+    """
+    rep = np.arange(len(wVals))
+    if getScaleDegree(wVec, aVec, self.nInput, self.nOutput) >= 0:
+      sign = np.sign(wVals)
+      rep = np.array([np.flatnonzero(sign == s)[0] for s in sign])
+    play, share = np.unique(rep, return_inverse=True)
+    return play, share
+
+  def getWeightVals(self, hyp, nVals=6):
+    """Returns shared weight values to test WANN with
+  
+    Args:
+      hyp     - (dict)     - hyperparameters
+        ['alg_wDist']        - weight distribution  [standard;fixed;linspace]
+
+    Optional:
+      nVals   - (int)      - number of weight values to test
+
+    Returns:
+      wVals   - (np_array) - weight values
+                [nVals X 1]
+    """
+    if (hyp['alg_wDist'] == "standard") and nVals==6: # Double, constant, and half signal 
+      return np.array((-2,-1.0,-0.5,0.5,1.0,2))
+    else:
+      return np.linspace(-self.absWCap, self.absWCap ,nVals)
+
+
+# -- Behavioral fingerprint ---------------------------------------------- -- #
+  def getProbeSet(self, nProbe, seed=0):
+    """Returns fixed set of positions to compare policies on
+    Random games are played in the vectorized environment (Reversi only) and
+    nProbe of the positions where the agent had to move are drawn from them.
+
+    Args:
+      nProbe  - (int)      - number of positions
+
+    Optional:
+      seed    - (int)      - random seed of games and draw
+
+    Returns:
+      state   - (np_array) - network input of each position
+                [nProbe X nInput]
+      legal   - (np_array) - legal moves in each position, bool
+                [nProbe X nOutput]
+    """
+    vecEnv = make_vec_env(self.envName, nProbe, autoreset=False)
+    vecEnv.seed(list(range(seed, seed+nProbe)))
+    rng = np.random.RandomState(seed)
+
+    state = vecEnv.reset()
+    states, legals = [], []
+    for tStep in range(self.maxEpisodeLength+1):
+      live = ~vecEnv.done
+      states.append(state[live])
+      legals.append(vecEnv.get_legal_moves()[live])
+      state, reward, done, info = vecEnv.step(rng.rand(nProbe, self.nOutput))
+      if np.all(done):
+        break
+
+    states, legals = np.vstack(states), np.vstack(legals)
+    probe = rng.choice(len(states), size=nProbe, replace=False)
+    return states[probe].astype(np.float64), legals[probe]
+
+  def getFingerprint(self, wVec, aVec, hyp, probes, nVals=6):
+    """Returns hash of the moves an individual picks on a probe set
+    Networks with the same set of best legal moves (ties included) on every 
+    probe position with every weight value get the same fingerprint. All values are evaluated by 
+    a single call to the compiled network.
+
+    Args:
+      wVec    - (np_array) - weight matrix as a flattened vector
+                [N**2 X 1]
+                [3 X nConn] - or edge list (see getEdgeList in ind.py)
+      aVec    - (np_array) - activation function of each node 
+                [N X 1]    - stored as ints (see applyAct in ann.py)
+      hyp     - (dict)     - hyperparameters (see getWeightVals)
+      probes  - (tuple)    - probe positions and their legal moves
+                             (see getProbeSet)
+
+    Optional:
+      nVals   - (int)      - number of weight values to test
+
+    Returns:
+      key     - (string)   - hex digest of best moves
+    """
+    state, legal = probes
+    wVals = self.getWeightVals(hyp, nVals)
+    plan = compileNet(self.setWeights(wVec,1.0), aVec, self.nInput,\
+                      self.nOutput)
+    annOut = act(plan, aVec, self.nInput, self.nOutput, \
+                 np.broadcast_to(state, (nVals,)+np.shape(state)), wVals)
+    annOut = np.where(legal, np.nan_to_num(annOut), -np.inf)
+
+    # Ties are broken randomly by the environment, so all best moves count
+    best = legal & (annOut == np.max(annOut, axis=-1, keepdims=True))
+    return hashlib.blake2b(np.packbits(best).tobytes(), digest_size=16).hexdigest()
@@ -8,6 +8,8 @@ import json
 # WANN functions
 from domain import *  # Task environments
 from .nsga_sort import nsga_sort
+from .archive import ParetoArchive
+from .innov import InnovRecord
 from .task import Task
 
 from .ind import Ind
@@ -25,25 +27,27 @@ class Wann():
       p       - (dict)     - algorithm hyperparameters (see p/hypkey.txt)
       pop     - (Ind)      - Current population
       species - (Species)  - Current species   
-      innov   - (np_array) - innovation record
-                [5 X nUniqueGenes]
-                [0,:] == Innovation Number
-                [1,:] == Source
-                [2,:] == Destination
-                [3,:] == New Node?
-                [4,:] == Generation evolved
+      innov   - (InnovRecord) - innovation record, see asArray for the
+                                array layout
       gen     - (int)      - Current generation
+      archive - (ParetoArchive) - non-dominated (fitness, connection count) 
+                                  of every individual evaluated so far
+      specThresh - (float)  - compatibility threshold of species, adapted
+                              toward hyp['spec_target'] species
     """
     self.p = hyp       # Hyperparameters
     self.pop = []      # Current population
     self.species = []  # Current species   
-    self.innov = []    # Innovation number (gene Id)
+    self.innov = InnovRecord() # Innovation number (gene Id)
     self.gen = 0
+    self.archive = ParetoArchive()
+    self.specThresh = hyp['spec_thresh']
 
   ''' Subfunctions '''
-  from ._variation import evolvePop, recombine, crossover,\
+  from ._variation import evolvePop, recombine, selectParents, breed,\
+                          breedJobs, breedJob, crossover,\
                           mutAddNode, mutAddConn, topoMutate
-  from ._speciate  import Species, speciate # Population container
+  from ._speciate  import Species, speciate, assignSpecies, assignOffspring
 
 
   def ask(self):
@@ -59,8 +63,33 @@ class Wann():
     return self.pop       # Send child population for evaluation
 
 
+  def askJobs(self):
+    """Returns elites and breeding jobs of the next population, children are
+    bred by workers (see breedJobs) and handed back with setPop
+    """
+    self.probMoo()      # Rank population according to objectives
+    self.speciate()     # Divide population into species
+    return self.breedJobs()
+
+  def setPop(self, elites, children, innovs):
+    """Sets population bred from jobs of askJobs
+    Innovations are merged in job order, children repeating an innovation
+    of an earlier child in the same generation get its ids, as when bred 
+    serially.
+
+    Args:
+      elites   - [Ind]      - individuals passed on unchanged
+      children - [Ind]      - child of each job
+      innovs   - [InnovRecord] - innovations of each child, in job order
+    """
+    for child, record in zip(children, innovs):
+      innovMap, nodeMap = self.innov.merge(record, child.node[0,:])
+      if innovMap or nodeMap:
+        child.renumber(innovMap, nodeMap)
+    self.pop = list(elites) + list(children)
+
   def tell(self,reward):
-    """Assigns fitness to current population
+    """Assigns fitness to current population, which ends the generation
 
     Args:
       reward - (np_array) - fitness value of each individual
@@ -71,6 +100,8 @@ class Wann():
       self.pop[i].fitness = np.mean(reward[i,:])
       self.pop[i].fitMax  = np.max( reward[i,:])
       self.pop[i].nConn   = self.pop[i].nConn
+    self.archive.update(self.pop, self.gen)
+    self.gen += 1
   
 
   def initPop(self):
@@ -108,17 +139,17 @@ class Wann():
     # Create population of individuals (for WANN weight value doesn't matter)
     pop = []
     for i in range(p['popSize']):
+        conn[3,:] = 1 #(2*(np.random.rand(1,nConn)-0.5))*p['ann_absWCap']
+        conn[4,:] = np.random.rand(1,nConn) < p['prob_initEnable']
         newInd = Ind(conn, node)
-        newInd.conn[3,:] = 1 #(2*(np.random.rand(1,nConn)-0.5))*p['ann_absWCap']
-        newInd.conn[4,:] = np.random.rand(1,nConn) < p['prob_initEnable']
         newInd.express()
         newInd.birth = 0
         pop.append(copy.deepcopy(newInd))  
 
     # - Create Innovation Record -
-    innov = np.zeros([5,nConn])
-    innov[0:3,:] = pop[0].conn[0:3,:]
-    innov[3,:] = -1
+    innov = InnovRecord(nextNode=len(nodeId))
+    for iConn in range(nConn):
+      innov.addConn(conn[1,iConn], conn[2,iConn], 0)
     
     self.pop = pop
     self.innov = innov
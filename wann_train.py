@@ -20,17 +20,30 @@ from domain import *   # Task environments
 def master(): 
   """Main WANN optimization script
   """
-  global fileName, hyp
+  global fileName, hyp, fitCache
   data = DataGatherer(fileName, hyp)
   wann = Wann(hyp)
+  fitCache = FitCache(hyp)
 
   for gen in range(hyp['maxGen']):        
-    pop = wann.ask()            # Get newly evolved individuals from WANN  
-    reward = batchMpiEval(pop)  # Send pop to evaluate
+    if hyp['alg_distBreed'] and len(wann.pop) > 0:
+      elites, jobs = wann.askJobs() # Children are bred by workers
+      seed = np.random.randint(1000)
+      reward = batchMpiEval(elites, seed=seed)
+      children, innovs, childReward = batchMpiBreed(jobs, seed)
+      wann.setPop(elites, children, innovs)
+      reward = np.vstack((reward, childReward))
+    else:
+      pop = wann.ask()            # Get newly evolved individuals from WANN  
+      reward = batchMpiEval(pop)  # Send pop to evaluate
     wann.tell(reward)           # Send fitness to WANN    
 
     data = gatherData(data,wann,gen,hyp)
-    print(gen, '\t - \t', data.display())
+    if fitCache.size > 0:
+      print(gen, '\t - \t', data.display(), \
+            '\t|---| Cache Hits: {:.0%}'.format(fitCache.hitRate()))
+    else:
+      print(gen, '\t - \t', data.display())
 
   # Clean up and data gathering at end of run
   data = gatherData(data,wann,gen,hyp,savePop=True)
@@ -53,7 +66,7 @@ def gatherData(data,wann,gen,hyp,savePop=False):
   Return:
     data - (DataGatherer) - updated run data
   """
-  data.gatherData(wann.pop, wann.species)
+  data.gatherData(wann.pop, wann.species, wann.archive)
   if (gen%hyp['save_mod']) == 0:
     #data = checkBest(data, bestReps=16)
     data = checkBest(data)
@@ -101,19 +114,25 @@ def checkBest(data):
 
 
 # -- Parallelization ----------------------------------------------------- -- #
-def batchMpiEval(pop, sameSeedForEachIndividual=True):
+def batchMpiEval(pop, sameSeedForEachIndividual=True, seed=None):
   """Sends population to workers for evaluation one batch at a time.
+  Each worker is sent a chunk of up to hyp['alg_evalChunk'] individuals
+  which it evaluates together.
 
   Args:
     pop - [Ind] - list of individuals
       .wMat - (np_array) - weight matrix of network
               [N X N] 
+      .wEdge - (np_array) - or its edge list, sent if hyp['alg_sparse']
+              [3 X nConn]
       .aVec - (np_array) - activation function of each node
               [N X 1]
 
   
   Optional:
       sameSeedForEachIndividual - (bool) - use same seed for each individual?
+                                  (results are only cached if so)
+      seed                      - (int)  - that seed, drawn if not given
 
   Return:
     reward  - (np_array) - fitness value of each individual
@@ -122,87 +141,181 @@ def batchMpiEval(pop, sameSeedForEachIndividual=True):
   Todo:
     * Asynchronous evaluation instead of batches
   """  
-  global nWorker, hyp
+  global nWorker, hyp, fitCache
+  keys = None
+  if fitCache.size > 0 and sameSeedForEachIndividual:
+    # Only send networks without a cached result (see FitCache)
+    keys = fitCache.keys(pop)
+    jobs = fitCache.lookup(keys)
+    pop  = [pop[iJob] for iJob in jobs]
+
   nSlave = nWorker-1
   nJobs = len(pop)
-  nBatch= math.ceil(nJobs/nSlave) # First worker is master
+  nChunk = max(1, hyp['alg_evalChunk'])  # Individuals sent in one message
+  nBatch= math.ceil(nJobs/(nSlave*nChunk)) # First worker is master
 
   # Set same seed for each individual
   if sameSeedForEachIndividual is False:
     seed = np.random.randint(1000, size=nJobs)
   else:
-    seed = np.random.randint(1000)
+    seed = np.full(nJobs, np.random.randint(1000) if seed is None else seed)
 
   reward = np.empty( (nJobs,hyp['alg_nVals']), dtype=np.float64)
   i = 0 # Index of fitness we are filling
   for iBatch in range(nBatch): # Send one batch of individuals
-    for iWork in range(nSlave): # (one to each worker if there)
-      if i < nJobs:
-        wVec   = pop[i].wMat.flatten()
+    chunks = []
+    for iWork in range(nSlave): # (one chunk to each worker if there)
+      chunk = range(i, min(i+nChunk, nJobs))
+      comm.send(len(chunk), dest=(iWork)+1, tag=1)
+      for iJob in chunk:
+        if hyp['alg_sparse']:
+          wVec = pop[iJob].wEdge.flatten()
+        else:
+          wVec = pop[iJob].wMat.flatten()
         n_wVec = np.shape(wVec)[0]
-        aVec   = pop[i].aVec.flatten()
+        aVec   = pop[iJob].aVec.flatten().astype(np.float64)
         n_aVec = np.shape(aVec)[0]
 
-        comm.send(n_wVec, dest=(iWork)+1, tag=1)
-        comm.Send(  wVec, dest=(iWork)+1, tag=2)
-        comm.send(n_aVec, dest=(iWork)+1, tag=3)
-        comm.Send(  aVec, dest=(iWork)+1, tag=4)
-        if sameSeedForEachIndividual is False:
-          comm.send(seed.item(i), dest=(iWork)+1, tag=5)
-        else:
-          comm.send(  seed, dest=(iWork)+1, tag=5)        
-
-      else: # message size of 0 is signal to shutdown workers
-        n_wVec = 0
-        comm.send(n_wVec,  dest=(iWork)+1)
-      i = i+1 
+        comm.send(n_wVec, dest=(iWork)+1, tag=2)
+        comm.Send(  wVec, dest=(iWork)+1, tag=3)
+        comm.send(n_aVec, dest=(iWork)+1, tag=4)
+        comm.Send(  aVec, dest=(iWork)+1, tag=5)
+      if len(chunk) > 0:
+        comm.send(seed[chunk.start:chunk.stop].tolist(), dest=(iWork)+1, tag=6)
+      chunks.append(chunk)
+      i += len(chunk)
   
     # Get fitness values back for that batch
-    i -= nSlave
-    for iWork in range(1,nSlave+1):
-      if i < nJobs:
-        workResult = np.empty(hyp['alg_nVals'], dtype='d')
-        comm.Recv(workResult, source=iWork)
-        reward[i,:] = workResult
-      i+=1
+    for iWork, chunk in enumerate(chunks):
+      if len(chunk) > 0:
+        workResult = np.empty((len(chunk), hyp['alg_nVals']), dtype='d')
+        comm.Recv(workResult, source=iWork+1)
+        reward[chunk.start:chunk.stop,:] = workResult
+
+  if keys is not None:
+    reward = fitCache.update(keys, jobs, reward)
   return reward
 
+def batchMpiBreed(jobs, seed):
+  """Sends breeding jobs to workers one batch at a time.
+  Each worker is sent a chunk of up to hyp['alg_evalChunk'] jobs, it breeds,
+  expresses and evaluates their children and sends them back.
+
+  Args:
+    jobs  - [tuple] - parents, innovation block and seed of each child 
+                      (see Wann.breedJobs)
+    seed  - (int)   - random seed of evaluation, same for each child
+
+  Return:
+    children - [Ind]      - child of each job
+    innovs   - [InnovRecord] - innovations of each child
+    reward   - (np_array) - fitness value of each child
+               [nJobs X nVals]
+  """
+  global nWorker, hyp, fitCache
+  nSlave = nWorker-1
+  nJobs = len(jobs)
+  nChunk = max(1, hyp['alg_evalChunk'])  # Jobs sent in one message
+  nBatch= math.ceil(nJobs/(nSlave*nChunk)) # First worker is master
+
+  children = [None]*nJobs
+  innovs   = [None]*nJobs
+  reward = np.empty( (nJobs,hyp['alg_nVals']), dtype=np.float64)
+  i = 0 # Index of job we are sending
+  for iBatch in range(nBatch): # Send one batch of jobs
+    chunks = []
+    for iWork in range(nSlave): # (one chunk to each worker if there)
+      chunk = range(i, min(i+nChunk, nJobs))
+      if len(chunk) > 0:
+        comm.send(-2, dest=(iWork)+1, tag=1)
+        comm.send((jobs[chunk.start:chunk.stop], seed), dest=(iWork)+1, tag=7)
+      else:
+        comm.send(0, dest=(iWork)+1, tag=1)
+      chunks.append(chunk)
+      i += len(chunk)
+
+    # Get children and their fitness values back for that batch
+    for iWork, chunk in enumerate(chunks):
+      if len(chunk) > 0:
+        workChildren, workInnovs, workResult = comm.recv(source=iWork+1, tag=8)
+        children[chunk.start:chunk.stop] = workChildren
+        innovs[chunk.start:chunk.stop] = workInnovs
+        reward[chunk.start:chunk.stop,:] = workResult
+
+  # Results are cached for elites of the next generation (see FitCache)
+  if fitCache.size > 0:
+    reward = fitCache.update(fitCache.keys(children), range(nJobs), reward)
+  return children, innovs, reward
+
 def slave():
   """Evaluation process: evaluates networks sent from master process. 
 
   PseudoArgs (recieved from master):
-    wVec   - (np_array) - weight matrix as a flattened vector
-             [1 X N**2]
-    n_wVec - (int)      - length of weight vector (N**2)
-    aVec   - (np_array) - activation function of each node 
-             [1 X N]    - stored as ints, see applyAct in ann.py
-    n_aVec - (int)      - length of activation vector (N)
-    seed   - (int)      - random seed (for consistency across workers)
+    nInd   - (int)      - number of individuals in chunk (0 = idle, -1 = stop,
+                          -2 = breeding jobs follow)
+    for each individual:
+      n_wVec - (int)      - length of weight vector (N**2, or 3*nConn)
+      wVec   - (np_array) - weight matrix as a flattened vector
+               [1 X N**2]
+               [1 X 3*nConn] - flattened edge list if hyp['alg_sparse']
+      n_aVec - (int)      - length of activation vector (N)
+      aVec   - (np_array) - activation function of each node 
+               [1 X N]    - stored as ints, see applyAct in ann.py
+    seed   - [int]      - random seed of each individual (for consistency 
+                          across workers)
+
+    or for breeding jobs (see batchMpiBreed):
+    jobs   - [tuple]    - parents, innovation block and seed of each child
+    seed   - (int)      - random seed of evaluation
 
   PseudoReturn (sent to master):
-    result - (float)    - fitness value of network
+    result - (np_array) - fitness values of each network in chunk
+             [nInd X nVals]
+    or for breeding jobs:
+    (children, innovs, result) - bred individuals, their innovations and 
+                                 fitness values
   """  
   global hyp  
   task = Task(games[hyp['task']], nReps=hyp['alg_nReps'])
+  wann = Wann(hyp) # Only breeds children
 
-  # Evaluate any weight vectors sent this way
+  # Evaluate any chunk of weight vectors sent this way
   while True:
-    n_wVec = comm.recv(source=0,  tag=1)# how long is the array that's coming?
-    if n_wVec > 0:
-      wVec = np.empty(n_wVec, dtype='d')# allocate space to receive weights
-      comm.Recv(wVec, source=0,  tag=2) # recieve weights
+    nInd = comm.recv(source=0,  tag=1)# how many networks are coming?
+    if nInd > 0:
+      wVecs, aVecs = [], []
+      for iInd in range(nInd):
+        n_wVec = comm.recv(source=0,tag=2)# how long is the array that's coming?
+        wVec = np.empty(n_wVec, dtype='d')# allocate space to receive weights
+        comm.Recv(wVec, source=0,  tag=3) # recieve weights
+        if hyp['alg_sparse']:
+          wVec = np.reshape(wVec, (3,-1)) # edge list
+
+        n_aVec = comm.recv(source=0,tag=4)# how long is the array that's coming?
+        aVec = np.empty(n_aVec, dtype='d')# allocate space to receive activation
+        comm.Recv(aVec, source=0,  tag=5) # recieve it
 
-      n_aVec = comm.recv(source=0,tag=3)# how long is the array that's coming?
-      aVec = np.empty(n_aVec, dtype='d')# allocate space to receive activation
-      comm.Recv(aVec, source=0,  tag=4) # recieve it
+        wVecs.append(wVec)
+        aVecs.append(aVec)
 
-      seed = comm.recv(source=0, tag=5) # random seed as int
+      seed = comm.recv(source=0, tag=6) # random seeds as ints
 
-      result = task.getDistFitness(wVec,aVec,hyp,seed=seed) # process it
+      result = task.getPopFitness(wVecs,aVecs,hyp,seed=seed) # process it
 
       comm.Send(result, dest=0) # send it back
 
-    if n_wVec < 0: # End signal recieved
+    if nInd == -2: # Breed, express and evaluate children
+      jobs, seed = comm.recv(source=0, tag=7)
+      children, innovs = zip(*[wann.breedJob(job) for job in jobs])
+      if hyp['alg_sparse']:
+        wVecs = [child.wEdge for child in children]
+      else:
+        wVecs = [child.wMat.flatten() for child in children]
+      aVecs = [child.aVec for child in children]
+      result = task.getPopFitness(wVecs,aVecs,hyp,seed=[seed]*len(jobs))
+      comm.send((list(children), list(innovs), result), dest=0, tag=8)
+
+    if nInd == -1: # End signal recieved
       print('Worker # ', rank, ' shutting down.')
       break
 